@@ -1,5 +1,3 @@
-import pandas as pd
-from io import BytesIO
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, generics
@@ -8,42 +6,56 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
 from django.conf import settings
-from .models import Election, Utilisateur, Vote, Resultat, ListeCandidats, Activite
-from .serializers import ElectionSerializer, UtilisateurSerializer, UtilisateurCreateSerializer, LoginSerializer, ListeCandidatsSerializer, FirstLoginSerializer
-from rest_framework_simplejwt.tokens import RefreshToken
+from .models import Election, Utilisateur, ListeCandidats, ElectionTally, ImportJob, BiometricSession
+from .serializers import ElectionSerializer, UtilisateurSerializer, UtilisateurCreateSerializer, LoginSerializer, ListeCandidatsSerializer, FirstLoginSerializer, ImportJobSerializer, BiometricSessionSerializer
 import logging
-from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from openpyxl import Workbook
-from django.http import HttpResponse
-from .serial_reader import get_fingerprint_from_sensor
-import serial
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from .eligibility import elections_for
+from .background import submit
+from .exports import ELECTION_HEADERS, USER_HEADERS, election_rows, user_rows, csv_response, xlsx_response
+from .tasks import run_user_import, run_biometric_session
+from .tallies import publish_results
+from .results_cache import results_version, results_etag, get_cached_results, set_cached_results
+from django.utils.http import parse_etags
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from .authentication import CachedRefreshToken, revoke, tokens_for
+from .streams import event_stream, event_stream_sync, mint_stream_ticket, read_stream_ticket
+from .serial_reader import get_sensor_pool
+from .grants import mint_grant, consume_grant, release_grant, InvalidGrant
+from .user_context import get_utilisateur, resolve_utilisateur
+from .login_pipeline import LoginRateThrottle, get_login_pool
+from django.contrib.auth.hashers import make_password
+import time
 
 logger = logging.getLogger(__name__)
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     def get_token(self, user):
-        token = super().get_token(user)
-        token['username'] = user.username
-        token['is_staff'] = user.is_staff
-        token['is_superuser'] = user.is_superuser
-        logger.info(f"Custom token payload for {user.username}: {token.payload}")
+        self.utilisateur = Utilisateur.objects.prefetch_related('activites').filter(user=user).first()
+        token = tokens_for(user, self.utilisateur)
+        logger.debug("Custom token payload for %s: %s", user.username, token.payload)
         return token
 
     def validate(self, attrs):
         data = super().validate(attrs)
-        user = self.user
-        try:
-            utilisateur = Utilisateur.objects.get(user=user)
-            data['is_first_login'] = utilisateur.is_first_login
-        except Utilisateur.DoesNotExist:
-            data['is_first_login'] = False
+        data['is_first_login'] = self.utilisateur.is_first_login if self.utilisateur else False
         return data
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+    throttle_classes = [LoginRateThrottle]
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = CachedRefreshToken
+
+class CachedTokenRefreshView(TokenRefreshView):
+    serializer_class = CachedTokenRefreshSerializer
 
 class LoginAPIView(APIView):
+    throttle_classes = [LoginRateThrottle]
+
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
         if serializer.is_valid():
@@ -52,9 +64,9 @@ class LoginAPIView(APIView):
             user = authenticate(username=username, password=password)
             if user:
                 try:
-                    utilisateur = Utilisateur.objects.get(user=user)
-                    refresh = RefreshToken.for_user(user)
-                    logger.info(f"User {username} logged in")
+                    utilisateur = Utilisateur.objects.prefetch_related('activites').get(user=user)
+                    refresh = tokens_for(user, utilisateur)
+                    logger.info("User %s logged in", username)
                     return Response({
                         'refresh': str(refresh),
                         'access': str(refresh.access_token),
@@ -66,38 +78,38 @@ class LoginAPIView(APIView):
             return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def _unknown_booth(booth):
+    return bool(booth) and booth not in get_sensor_pool().booths()
+
 class FirstLoginAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
         serializer = FirstLoginSerializer(data=request.data)
         if serializer.is_valid():
+            # Read from the database: enrolling replaces the password and
+            # fingerprint, so a stale is_first_login must never let it run twice.
             try:
-                utilisateur = Utilisateur.objects.get(user=request.user)
-                if not utilisateur.is_first_login:
-                    return Response({"error": "Not first login"}, status=status.HTTP_400_BAD_REQUEST)
-                new_password = serializer.validated_data['new_password']
-                try:
-                    fingerprint_id = get_fingerprint_from_sensor(mode='enroll', user_id=utilisateur.id)
-                    if not fingerprint_id:
-                        logger.error("Failed to enroll fingerprint")
-                        return Response({"error": "Failed to enroll fingerprint"}, status=status.HTTP_400_BAD_REQUEST)
-                    utilisateur.fingerprint_id = fingerprint_id
-                    utilisateur.user.set_password(new_password)
-                    utilisateur.is_first_login = False
-                    utilisateur.user.save()
-                    utilisateur.save()
-                    logger.info(f"First login completed for {request.user.username}, fingerprint_id={fingerprint_id}")
-                    return Response({"message": "Password and fingerprint updated"}, status=status.HTTP_200_OK)
-                except serial.serialutil.SerialException as e:
-                    logger.error(f"Serial error: {str(e)}")
-                    return Response({"error": "Failed to communicate with fingerprint sensor"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                utilisateur = Utilisateur.objects.get(user_id=request.user.id)
             except Utilisateur.DoesNotExist:
                 return Response({"error": "Utilisateur non trouvé"}, status=status.HTTP_404_NOT_FOUND)
-            except Exception as e:
-                logger.error(f"Fingerprint error: {str(e)}")
-                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        logger.error(f"Serializer errors: {serializer.errors}")
+            if not utilisateur.is_first_login:
+                return Response({"error": "Not first login"}, status=status.HTTP_400_BAD_REQUEST)
+            booth = str(request.data.get('booth') or '')[:50]
+            if _unknown_booth(booth):
+                return Response({"error": "Poste de vote inconnu"}, status=status.HTTP_400_BAD_REQUEST)
+            session = BiometricSession.objects.create(
+                mode='enroll', utilisateur=utilisateur,
+                password=make_password(serializer.validated_data['new_password']), booth=booth,
+            )
+            submit(run_biometric_session, session.id)
+            logger.info("Enroll session %s started for %s", session.id, request.user.username)
+            return Response({
+                "message": "Placez votre doigt sur le capteur",
+                "session_id": session.id,
+                **BiometricSessionSerializer(session).data,
+            }, status=status.HTTP_202_ACCEPTED)
+        logger.error("Serializer errors: %s", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class FingerprintVerifyAPIView(APIView):
@@ -105,21 +117,53 @@ class FingerprintVerifyAPIView(APIView):
 
     def post(self, request):
         try:
-            utilisateur = Utilisateur.objects.get(user=request.user)
-            fingerprint_id = get_fingerprint_from_sensor(mode='verify')
-            if fingerprint_id and fingerprint_id == utilisateur.fingerprint_id:
-                logger.info(f"Fingerprint verified for user {request.user.username}, fingerprint_id={fingerprint_id}")
-                return Response({"message": "Fingerprint verified"}, status=status.HTTP_200_OK)
-            logger.error(f"Fingerprint verification failed for {request.user.username}, received_id={fingerprint_id}, expected_id={utilisateur.fingerprint_id}")
-            return Response({"error": "Fingerprint verification failed"}, status=status.HTTP_400_BAD_REQUEST)
+            utilisateur = resolve_utilisateur(request)
         except Utilisateur.DoesNotExist:
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
-        except serial.serialutil.SerialException as e:
-            logger.error(f"Serial error: {str(e)}")
-            return Response({"error": "Failed to communicate with fingerprint sensor"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        except Exception as e:
-            logger.error(f"Verification error: {str(e)}")
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        booth = str(request.data.get('booth') or '')[:50]
+        if _unknown_booth(booth):
+            return Response({"error": "Poste de vote inconnu"}, status=status.HTTP_400_BAD_REQUEST)
+        session = BiometricSession.objects.create(mode='verify', utilisateur=utilisateur, booth=booth)
+        submit(run_biometric_session, session.id)
+        logger.info("Verify session %s started for %s", session.id, request.user.username)
+        return Response({
+            "message": "Placez votre doigt sur le capteur",
+            "session_id": session.id,
+            **BiometricSessionSerializer(session).data,
+        }, status=status.HTTP_202_ACCEPTED)
+
+class BiometricSessionAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, session_id):
+        session = get_object_or_404(BiometricSession.objects.select_related('utilisateur'), id=session_id)
+        if not request.user.is_staff and session.utilisateur.user_id != request.user.id:
+            return Response({"error": "Accès non autorisé"}, status=status.HTTP_403_FORBIDDEN)
+        # Optional long-poll: ?wait=<seconds>, capped by BIOMETRIC_SESSION_MAX_WAIT.
+        try:
+            wait = min(float(request.query_params.get('wait', 0)), settings.BIOMETRIC_SESSION_MAX_WAIT)
+        except ValueError:
+            wait = 0
+        deadline = time.monotonic() + wait
+        while not session.is_finished() and time.monotonic() < deadline:
+            time.sleep(0.25)
+            session.refresh_from_db(fields=['statut', 'fingerprint_id', 'sensor', 'error', 'finished_at'])
+        data = BiometricSessionSerializer(session).data
+        if session.mode == 'verify' and session.statut == 'reussi' and session.utilisateur.user_id == request.user.id:
+            data['grant'] = mint_grant(session)
+        return Response(data)
+
+class LoginMetricsAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_login_pool().stats())
+
+class SensorPoolAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({"sensors": get_sensor_pool().stats()})
 
 class UserImportAPIView(APIView):
     permission_classes = [IsAdminUser]
@@ -130,80 +174,23 @@ class UserImportAPIView(APIView):
             logger.error("No file uploaded")
             return Response({"error": "No file uploaded"}, status=status.HTTP_400_BAD_REQUEST)
         if not file.name.endswith(('.xlsx', '.xls')):
-            logger.error(f"Invalid file format: {file.name}")
+            logger.error("Invalid file format: %s", file.name)
             return Response({"error": "Invalid file format"}, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            df = pd.read_excel(file)
-            logger.info(f"Excel columns: {list(df.columns)}")
-            required_columns = ['matricule', 'nom', 'username', 'annee_universitaire', 'classe', 'mention', 'activites']
-            if not all(col in df.columns for col in required_columns):
-                missing = [col for col in required_columns if col not in df.columns]
-                logger.error(f"Missing required columns: {missing}")
-                return Response({"error": f"Missing required columns: {missing}"}, status=status.HTTP_400_BAD_REQUEST)
-            created_count = 0
-            updated_count = 0
-            for index, row in df.iterrows():
-                matricule = str(row['matricule']).strip()
-                if not matricule.isdigit() or len(matricule) != 4:
-                    logger.warning(f"Invalid matricule at row {index + 2}: {matricule}")
-                    continue
-                activites = str(row['activites']).strip().split(',') if pd.notna(row['activites']) else []
-                activite_ids = []
-                for activite in activites:
-                    activite = activite.strip().upper()
-                    if activite in [choice[0] for choice in Activite.ACTIVITE_CHOICES]:
-                        activite_obj, _ = Activite.objects.get_or_create(nom=activite)
-                        activite_ids.append(activite_obj.id)
-                data = {
-                    'matricule': matricule,
-                    'nom': str(row['nom']).strip(),
-                    'username': str(row['username']).strip(),
-                    'annee_universitaire': str(row['annee_universitaire']).strip(),
-                    'classe': int(row['classe']),
-                    'mention': str(row['mention']).strip(),
-                    'activite_ids': activite_ids,
-                    'sport_type': str(row['sport_type']).strip() if 'sport_type' in df.columns and pd.notna(row['sport_type']) else None,
-                }
-                logger.info(f"Processing row {index + 2}: {data}")
-                try:
-                    utilisateur = Utilisateur.objects.get(matricule=matricule)
-                    user = utilisateur.user
-                    user.username = data['username']
-                    user.save()
-                    utilisateur.nom = data['nom']
-                    utilisateur.annee_universitaire = data['annee_universitaire']
-                    utilisateur.classe = data['classe']
-                    utilisateur.mention = data['mention']
-                    utilisateur.sport_type = data['sport_type']
-                    utilisateur.is_first_login = True
-                    utilisateur.save()
-                    utilisateur.activites.set(Activite.objects.filter(id__in=data['activite_ids']))
-                    updated_count += 1
-                except Utilisateur.DoesNotExist:
-                    if User.objects.filter(username=data['username']).exists():
-                        logger.warning(f"Username {data['username']} already exists at row {index + 2}")
-                        continue
-                    user = User.objects.create_user(
-                        username=data['username'],
-                        password=data['matricule']
-                    )
-                    utilisateur = Utilisateur.objects.create(
-                        nom=data['nom'],
-                        matricule=data['matricule'],
-                        annee_universitaire=data['annee_universitaire'],
-                        is_first_login=True,
-                        user=user,
-                        classe=data['classe'],
-                        mention=data['mention'],
-                        sport_type=data['sport_type']
-                    )
-                    utilisateur.activites.set(Activite.objects.filter(id__in=data['activite_ids']))
-                    created_count += 1
-            logger.info(f"Imported {created_count} new users, updated {updated_count} users")
-            return Response({"message": f"Imported {created_count} new users, updated {updated_count} users"}, status=status.HTTP_200_OK)
-        except Exception as e:
-            logger.error(f"Import error: {str(e)}")
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        job = ImportJob.objects.create(file=file, created_by_id=request.user.id)
+        submit(run_user_import, job.id)
+        logger.info("Import job %s queued by %s for %s", job.id, request.user.username, file.name)
+        return Response({
+            "message": "Import en cours",
+            "job_id": job.id,
+            **ImportJobSerializer(job).data,
+        }, status=status.HTTP_202_ACCEPTED)
+
+class ImportJobDetailAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(ImportJob, id=job_id)
+        return Response(ImportJobSerializer(job).data)
 
 class ListeCandidatsCreateAPIView(APIView):
     permission_classes = [IsAdminUser]
@@ -217,7 +204,9 @@ class ListeCandidatsCreateAPIView(APIView):
             liste_candidats = serializer.save()
             candidates = Utilisateur.objects.filter(id__in=candidate_ids)
             liste_candidats.candidats.set(candidates)
-            logger.info(f"ListeCandidats {liste_candidats.nom} created by {request.user.username}, candidates={[c.nom for c in liste_candidats.candidats.all()]}")
+            logger.info("ListeCandidats %s created by %s, %s candidates", liste_candidats.nom, request.user.username, len(candidates))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("ListeCandidats %s candidates=%s", liste_candidats.nom, [c.nom for c in candidates])
             return Response(ListeCandidatsSerializer(liste_candidats).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -227,34 +216,27 @@ class ListeCandidatsListAPIView(APIView):
     def get(self, request):
         listes = ListeCandidats.objects.prefetch_related('candidats').all()
         serializer = ListeCandidatsSerializer(listes, many=True)
-        logger.info(f"Returning {len(listes)} candidate lists")
+        logger.debug("Returning %s candidate lists", len(listes))
         return Response(serializer.data)
 
 class ElectionListCreateAPIView(generics.ListCreateAPIView):
     queryset = Election.objects.all()
     serializer_class = ElectionSerializer
     permission_classes = [IsAuthenticated]
+    query_budget = {'GET': 12}
 
     def get_queryset(self):
         user = self.request.user
-        logger.info(f"Filtering elections for user {user.username} (id={user.id})")
+        logger.debug("Filtering elections for user %s (id=%s)", user.username, user.id)
         if user.is_staff or user.is_superuser:
-            logger.info("User is admin, returning all elections")
-            return Election.objects.all()
+            logger.debug("User is admin, returning all elections")
+            return ElectionSerializer.setup_eager_loading(Election.objects.all())
         try:
-            utilisateur = Utilisateur.objects.get(user=user)
-            logger.info(f"Utilisateur found: {utilisateur}, classe: {utilisateur.classe}")
-            allowed_elections = []
-            for election in Election.objects.all():
-                logger.info(f"Checking election {election.nom} (id={election.id}), allowed_voter_criteria={election.allowed_voter_criteria}")
-                if election.is_voter_allowed(utilisateur):
-                    logger.info(f"Election {election.nom} is allowed for user")
-                    allowed_elections.append(election.id)
-            queryset = Election.objects.filter(id__in=allowed_elections)
-            logger.info(f"Returning {queryset.count()} elections: {[e.id for e in queryset]}")
-            return queryset
+            utilisateur = resolve_utilisateur(self.request)
+            logger.debug("Utilisateur found: %s, classe: %s", utilisateur, utilisateur.classe)
+            return ElectionSerializer.setup_eager_loading(elections_for(utilisateur))
         except Utilisateur.DoesNotExist:
-            logger.warning(f"No Utilisateur found for user {user.username}")
+            logger.warning("No Utilisateur found for user %s", user.username)
             return Election.objects.none()
 
     def post(self, request):
@@ -263,21 +245,24 @@ class ElectionListCreateAPIView(generics.ListCreateAPIView):
         serializer = ElectionSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             election = serializer.save()
-            logger.info(f"Election {election.nom} created by {request.user.username}, listeCandidats={election.listeCandidats.nom if election.listeCandidats else None}, candidates={[c.nom for c in election.listeCandidats.candidats.all()] if election.listeCandidats else []}")
+            logger.info("Election %s created by %s, listeCandidats=%s", election.nom, request.user.username, election.listeCandidats_id)
+            if election.listeCandidats_id and logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Election %s candidates=%s", election.nom, [c.nom for c in election.listeCandidats.candidats.all()])
             return Response(ElectionSerializer(election, context={'request': request}).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class ElectionDetailAPIView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'GET': 14}
 
     def get(self, request, idElection):
-        logger.info(f"Fetching election with id={idElection} for user={request.user.username}")
-        election = get_object_or_404(Election, id=idElection)
+        logger.debug("Fetching election with id=%s for user=%s", idElection, request.user.username)
+        election = get_object_or_404(ElectionSerializer.setup_eager_loading(Election.objects.all()), id=idElection)
         if request.user.is_staff:
             serializer = ElectionSerializer(election, context={'request': request})
             return Response(serializer.data)
         try:
-            utilisateur = Utilisateur.objects.get(user=request.user)
+            utilisateur = resolve_utilisateur(request)
             if not election.is_voter_allowed(utilisateur):
                 return Response({"error": "Accès non autorisé"}, status=status.HTTP_403_FORBIDDEN)
         except Utilisateur.DoesNotExist:
@@ -292,7 +277,7 @@ class ElectionDetailAPIView(APIView):
         serializer = ElectionSerializer(election, data=request.data, partial=True, context={'request': request})
         if serializer.is_valid():
             serializer.save()
-            logger.info(f"Election {election.nom} updated by {request.user.username}")
+            logger.info("Election %s updated by %s", election.nom, request.user.username)
             return Response(ElectionSerializer(election, context={'request': request}).data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -301,36 +286,47 @@ class ElectionDetailAPIView(APIView):
             return Response({"error": "Permission denied"}, status=status.HTTP_403_FORBIDDEN)
         election = get_object_or_404(Election, id=idElection)
         election.delete()
-        logger.info(f"Election {idElection} deleted by {request.user.username}")
+        logger.info("Election %s deleted by %s", idElection, request.user.username)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 class VoterAPIView(APIView):
     permission_classes = [IsAuthenticated]
+    # The first ballot of an election also creates its tally rows.
+    query_budget = {'POST': 16}
 
     def post(self, request, idElection):
-        logger.info(f"Vote attempt by user {request.user.id} for election {idElection}")
+        logger.info("Vote attempt by user %s for election %s", request.user.id, idElection)
         election = get_object_or_404(Election, id=idElection)
         if not election.is_open():
             return Response({"error": "Cette élection est fermée"}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            utilisateur = Utilisateur.objects.get(user=request.user)
+            utilisateur = resolve_utilisateur(request)
         except Utilisateur.DoesNotExist:
             return Response({"error": "Utilisateur non autorisé à voter"}, status=status.HTTP_403_FORBIDDEN)
         if not election.is_voter_allowed(utilisateur):
             return Response({"error": "Type d'utilisateur non autorisé à voter"}, status=status.HTTP_403_FORBIDDEN)
-        if utilisateur.has_voted(election):
-            return Response({"error": "Vous avez déjà voté"}, status=status.HTTP_400_BAD_REQUEST)
-        candidate_id = request.data.get('candidate')
         try:
-            candidat = get_object_or_404(Utilisateur, id=candidate_id)
-            if candidat not in election.listeCandidats.candidats.all():
-                return Response({"error": "Candidat non valide pour cette élection"}, status=status.HTTP_400_BAD_REQUEST)
-            vote = utilisateur.voter(candidat, election)
-            vote.enregistrerVote()
-            logger.info(f"Vote recorded for {candidat.nom} by {request.user.username}")
+            candidate_id = int(request.data.get('candidate'))
+        except (TypeError, ValueError):
+            return Response({"error": "Candidat non valide pour cette élection"}, status=status.HTTP_400_BAD_REQUEST)
+        grant_session = None
+        if settings.BIOMETRIC_VOTE_REQUIRED:
+            grant = request.headers.get('X-Biometric-Grant') or request.data.get('biometric_grant')
+            if not grant:
+                return Response({"error": "Vérification biométrique requise"}, status=status.HTTP_403_FORBIDDEN)
+            try:
+                grant_session = consume_grant(grant, utilisateur)
+            except InvalidGrant as e:
+                return Response({"error": str(e)}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            utilisateur.voter(candidate_id, election)
+            logger.info("Vote recorded for candidate %s by %s", candidate_id, request.user.username)
             return Response({"message": "Vote enregistré avec succès"}, status=status.HTTP_201_CREATED)
         except Exception as e:
-            logger.error(f"Vote error: {str(e)}")
+            # No ballot was stored: the student may retry without a new scan.
+            if grant_session is not None:
+                release_grant(grant_session)
+            logger.error("Vote error: %s", e)
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 class PublierResultatsAPIView(APIView):
@@ -338,18 +334,10 @@ class PublierResultatsAPIView(APIView):
 
     def post(self, request, idElection):
         election = get_object_or_404(Election, id=idElection)
-        if election.is_open():
+        if election.is_open() or election.statut == 'a_venir':
             return Response({"error": "L'élection est encore ouverte"}, status=status.HTTP_400_BAD_REQUEST)
-        result, created = Resultat.objects.get_or_create(election=election)
-        votes = Vote.objects.filter(election=election, electeur__in=[
-            u for u in Utilisateur.objects.all() if election.is_voter_allowed(u)
-        ], estNul=False)
-        result.listeVote.set(votes)
-        result.save()
-        election.resultat = result
-        election.statut = 'ferme'
-        election.save()
-        logger.info(f"Results published for election {idElection} by {request.user.username}")
+        publish_results(election)
+        logger.info("Results published for election %s by %s", idElection, request.user.username)
         return Response({"message": "Résultats publiés avec succès"}, status=status.HTTP_200_OK)
 
 class UtilisateurCreateAPIView(APIView):
@@ -359,7 +347,7 @@ class UtilisateurCreateAPIView(APIView):
         serializer = UtilisateurCreateSerializer(data=request.data)
         if serializer.is_valid():
             utilisateur = serializer.save()
-            logger.info(f"User {request.data['username']} created by {request.user.username}")
+            logger.info("User %s created by %s", request.data['username'], request.user.username)
             return Response(UtilisateurSerializer(utilisateur).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -454,138 +442,155 @@ class LogoutAPIView(APIView):
     def post(self, request):
         try:
             refresh_token = request.data.get("refresh")
-            token = RefreshToken(refresh_token)
+            token = CachedRefreshToken(refresh_token)
             token.blacklist()
-            logger.info(f"User {request.user.username} logged out")
+            # The access token used for this call dies with the session too.
+            revoke(request.auth)
+            logger.info("User %s logged out", request.user.username)
             return Response({"message": "Déconnexion réussie"}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 class ElectionResultsAPIView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'GET': 16}
 
     def get(self, request, idElection):
-        election = get_object_or_404(Election, id=idElection)
+        election = get_object_or_404(Election.objects.select_related('resultat'), id=idElection)
+        utilisateur = None
         try:
-            utilisateur = Utilisateur.objects.get(user=request.user)
+            utilisateur = resolve_utilisateur(request)
             if not (request.user.is_staff or election.is_voter_allowed(utilisateur)):
                 return Response({"error": "Accès non autorisé"}, status=status.HTTP_403_FORBIDDEN)
         except Utilisateur.DoesNotExist:
             if not request.user.is_staff:
                 return Response({"error": "Utilisateur non trouvé"}, status=status.HTTP_404_NOT_FOUND)
+        if not request.user.is_staff and not election.resultat:
+            return Response({"error": "Les résultats n'ont pas encore été publiés"}, status=status.HTTP_400_BAD_REQUEST)
+        # can_vote is the only per-user field of the payload
+        can_vote = (
+            utilisateur is not None and not request.user.is_staff and
+            election.is_open() and not utilisateur.has_voted(election)
+        )
+
+        if not getattr(settings, 'SHARED_CACHE', False):
+            # A per-process version would miss the bumps made by the worker
+            # that took the vote, so nothing is cached or revalidated.
+            data = self.build_results(idElection, request)
+            data['election']['can_vote'] = can_vote
+            return Response(data, headers={'Cache-Control': 'private, no-cache'})
+
+        # Clients poll this endpoint: the payload is cached per results version
+        # and a matching If-None-Match gets a 304 without rebuilding it.
+        version = results_version(idElection)
+        etag = results_etag(idElection, version, request.user.id)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag, 'Cache-Control': 'private, no-cache'})
+        data = get_cached_results(idElection, version)
+        if data is None:
+            data = self.build_results(idElection, request)
+            set_cached_results(idElection, version, data, published=data['is_published'])
+        data = {**data, 'election': {**data['election'], 'can_vote': can_vote}}
+        return Response(data, headers={'ETag': etag, 'Cache-Control': 'private, no-cache'})
+
+    def build_results(self, idElection, request):
+        election = ElectionSerializer.setup_eager_loading(Election.objects.all()).get(id=idElection)
+        if election.resultat:
+            # Published: everything comes from the frozen snapshot
+            snapshot = election.resultat
+            return {
+                'election': ElectionSerializer(election, context={'request': request}).data,
+                'results': snapshot.results,
+                'candidates': [{'nom': entry['nom'], 'vote_count': entry['vote_count']} for entry in snapshot.candidate_counts],
+                'total_voters': snapshot.total_voters,
+                'voters_who_voted': snapshot.voters_who_voted,
+                'is_published': True
+            }
 
-        # Calculate real-time vote counts
+        # Real-time vote counts come from the tallies maintained at vote time
+        tallies = list(election.candidate_tallies.filter(vote_count__gt=0).select_related('candidat'))
+        counts = {tally.candidat_id: tally.vote_count for tally in tallies}
         candidates = [
-            {'nom': candidate.nom, 'vote_count': candidate.get_vote_count(election)}
+            {'nom': candidate.nom, 'vote_count': counts.get(candidate.id, 0)}
             for candidate in election.listeCandidats.candidats.all()
         ]
         results = {}
-        votes = Vote.objects.filter(election=election, estNul=False)
-        for vote in votes:
-            candidate_name = vote.choix.nom
-            results[candidate_name] = results.get(candidate_name, 0) + 1
+        for tally in tallies:
+            results[tally.candidat.nom] = results.get(tally.candidat.nom, 0) + tally.vote_count
+        election_tally = ElectionTally.objects.filter(election=election).first()
 
-        data = {
+        return {
             'election': ElectionSerializer(election, context={'request': request}).data,
             'results': results,
             'candidates': candidates,
-            'total_voters': len([u for u in Utilisateur.objects.all() if election.is_voter_allowed(u)]),
-            'voters_who_voted': votes.count(),
-            'is_published': bool(election.resultat)
+            'total_voters': election.eligible_voters().count(),
+            'voters_who_voted': election_tally.vote_count if election_tally else 0,
+            'is_published': False
         }
-        if not request.user.is_staff and not election.resultat:
-            return Response({"error": "Les résultats n'ont pas encore été publiés"}, status=status.HTTP_400_BAD_REQUEST)
-        return Response(data)
+
+def _stream_access_error(request, idElection):
+    # Same access rules as ElectionResultsAPIView, for request.user.
+    election = Election.objects.filter(id=idElection).select_related('resultat').first()
+    if election is None:
+        return {"error": "Élection non trouvée"}, 404
+    if request.user.is_staff:
+        return None
+    utilisateur = get_utilisateur(request)
+    if utilisateur is None or not election.is_voter_allowed(utilisateur):
+        return {"error": "Accès non autorisé"}, 403
+    if not election.resultat:
+        return {"error": "Les résultats n'ont pas encore été publiés"}, 400
+    return None
+
+class ElectionResultsStreamTicketAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, idElection):
+        error = _stream_access_error(request, idElection)
+        if error is not None:
+            return Response(error[0], status=error[1])
+        return Response({"ticket": mint_stream_ticket(request.user.id, idElection)})
+
+def election_results_stream(request, idElection):
+    # Server-sent events with live turnout and tally deltas, opened with a
+    # ticket from .../resultats/stream/ticket/ (EventSource cannot send an
+    # Authorization header). Under ASGI the stream is an asyncio task; under
+    # WSGI it holds the worker thread and closes after
+    # RESULTS_STREAM_WSGI_MAX_SECONDS, and the browser reconnects.
+    user_id = read_stream_ticket(request.GET.get('ticket', ''), idElection)
+    user = User.objects.filter(id=user_id, is_active=True).first() if user_id is not None else None
+    if user is None:
+        return JsonResponse({"error": "Authentification requise"}, status=401)
+    request.user, request.auth = user, None
+    error = _stream_access_error(request, idElection)
+    if error is not None:
+        return JsonResponse(error[0], status=error[1])
+    stream = event_stream(idElection) if isinstance(request, ASGIRequest) else event_stream_sync(idElection)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 class ExportElectionsExcelAPIView(APIView):
     permission_classes = [IsAdminUser]
 
     def get(self, request):
-        elections = Election.objects.all()
-        data = [
-            {
-                'nom': e.nom,
-                'startdate': e.startdate.strftime('%d/%m/%Y %H:%M'),
-                'enddate': e.enddate.strftime('%d/%m/%Y %H:%M'),
-                'statut': e.statut,
-                'voters_who_voted': e.votes.filter(estNul=False).count(),
-                'total_voters': len([u for u in Utilisateur.objects.all() if e.is_voter_allowed(u)]),
-            }
-            for e in elections
-        ]
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Elections"
-        headers = ['Nom', 'Date de début', 'Date de fin', 'Statut', 'Votants', 'Électeurs totaux']
-        ws.append(headers)
-        for row in data:
-            ws.append([row['nom'], row['startdate'], row['enddate'], row['statut'], row['voters_who_voted'], row['total_voters']])
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        response = HttpResponse(
-            content=output.getvalue(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = 'attachment; filename=elections.xlsx'
-        return response
+        return xlsx_response("Elections", ELECTION_HEADERS, election_rows(), 'elections.xlsx')
+
+class ExportElectionsCSVAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return csv_response(ELECTION_HEADERS, election_rows(), 'elections.csv')
 
 class ExportUsersExcelAPIView(APIView):
     permission_classes = [IsAdminUser]
 
     def get(self, request):
-        users = Utilisateur.objects.all()
-        def get_classe_label(classe):
-            classes = {1: 'L1', 2: 'L2', 3: 'L3', 4: 'M1', 5: 'M2'}
-            return classes.get(classe, 'Inconnu')
-
-        def get_mention_label(mention):
-            mentions = {
-                'INFO': 'Informatique',
-                'SA': 'Sciences Agronomiques',
-                'ECO': 'Économie et Commerce',
-                'LEA': 'Langues Étrangères Appliquées',
-                'ST': 'Sciences de la Terre',
-                'DROIT': 'Droit',
-            }
-            return mentions.get(mention, 'Inconnu')
-
-        def get_activites_label(activites):
-            return ', '.join(activite.nom for activite in activites.all()) if activites.exists() else 'N/A'
-
-        data = [
-            {
-                'nom': u.nom,
-                'prenom': u.user.username,
-                'classe': get_classe_label(u.classe),
-                'mention': get_mention_label(u.mention),
-                'activites': get_activites_label(u.activites),
-                'sport_type': u.sport_type or 'N/A',
-                'annee_universitaire': u.annee_universitaire or 'N/A',
-            }
-            for u in users
-        ]
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Users"
-        headers = ['Nom', 'Prénom', 'Classe', 'Mention', 'Activités', 'Type de sport', 'Année universitaire']
-        ws.append(headers)
-        for row in data:
-            ws.append([
-                row['nom'],
-                row['prenom'],
-                row['classe'],
-                row['mention'],
-                row['activites'],
-                row['sport_type'],
-                row['annee_universitaire'],
-            ])
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        response = HttpResponse(
-            output.getvalue(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = 'attachment; filename=users.xlsx'
-        return response
\ No newline at end of file
+        return xlsx_response("Users", USER_HEADERS, user_rows(), 'users.xlsx')
+
+class ExportUsersCSVAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return csv_response(USER_HEADERS, user_rows(), 'users.csv')
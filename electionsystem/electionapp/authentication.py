@@ -0,0 +1,113 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from .user_context import profile_version
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Revoked JTIs live in the cache until the token would have expired anyway.
+# The cache is seeded from BlacklistedToken once per cache lifetime; with a
+# SHARED_CACHE that makes refresh checks query-free, while a per-process cache
+# cannot see other workers' revocations, so refresh tokens are then also
+# checked against the blacklist tables. Revoked access tokens only exist in
+# the cache.
+
+
+def _revoked_key(jti):
+    return f"jwt-revoked:{jti}"
+
+
+def _warm_revoked():
+    if not cache.add('jwt-revoked-warm', True, timeout=None):
+        return
+    now = timezone.now()
+    revoked = BlacklistedToken.objects.filter(token__expires_at__gt=now).values_list('token__jti', 'token__expires_at')
+    cache.set_many({
+        _revoked_key(jti): True for jti, expires_at in revoked
+    }, timeout=None)
+    logger.info("Loaded revoked token ids into the cache")
+
+
+def revoke(token):
+    remaining = int(token['exp'] - timezone.now().timestamp())
+    if remaining > 0:
+        cache.set(_revoked_key(token[api_settings.JTI_CLAIM]), True, timeout=remaining)
+
+
+def is_revoked(token):
+    _warm_revoked()
+    return cache.get(_revoked_key(token[api_settings.JTI_CLAIM])) is not None
+
+
+class CachedRefreshToken(RefreshToken):
+    def check_blacklist(self):
+        if is_revoked(self):
+            raise TokenError("Token is blacklisted")
+        if not getattr(settings, 'SHARED_CACHE', False):
+            super().check_blacklist()
+
+    def blacklist(self):
+        blacklisted = super().blacklist()
+        revoke(self)
+        return blacklisted
+
+
+def tokens_for(user, utilisateur=None):
+    # Everything the API needs about the caller travels in the token, so
+    # ClaimsJWTAuthentication and user_context.get_utilisateur need no query.
+    refresh = CachedRefreshToken.for_user(user)
+    refresh['username'] = user.username
+    refresh['is_staff'] = user.is_staff
+    refresh['is_superuser'] = user.is_superuser
+    refresh['profile_version'] = profile_version(user.id)
+    if utilisateur is not None:
+        refresh['utilisateur'] = {
+            'id': utilisateur.id,
+            'nom': utilisateur.nom,
+            'classe': utilisateur.classe,
+            'mention': utilisateur.mention,
+            'sport_type': utilisateur.sport_type,
+            'activites': [activite.nom for activite in utilisateur.activites.all()],
+            'is_first_login': utilisateur.is_first_login,
+            'fingerprint_id': utilisateur.fingerprint_id,
+        }
+    return refresh
+
+
+class ClaimsUser(TokenUser):
+    # TokenUser keeps the user_id claim as simplejwt writes it, a string;
+    # views compare request.user.id with integer foreign keys.
+    @cached_property
+    def id(self):
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWT authentication that trusts the token's claims instead of loading
+    the User row, as long as they carry the user's current profile_version.
+
+    That check only means something with a SHARED_CACHE: User changes
+    (is_staff, is_active, ...) bump the version, but a per-process cache never
+    sees bumps made by other workers. Without one, and for tokens issued
+    before the claims existed, the User row is loaded as usual."""
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if is_revoked(token):
+            raise InvalidToken("Token is blacklisted")
+        return token
+
+    def get_user(self, validated_token):
+        if (getattr(settings, 'SHARED_CACHE', False) and 'username' in validated_token
+                and 'profile_version' in validated_token
+                and validated_token['profile_version'] == profile_version(int(validated_token[api_settings.USER_ID_CLAIM]))):
+            return ClaimsUser(validated_token)
+        return super().get_user(validated_token)
@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, transaction
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def _queue_for(task):
+    route = getattr(settings, 'CELERY_TASK_ROUTES', {}).get(task.name)
+    return route['queue'] if route else 'default'
+
+
+def _get_executor(queue):
+    # One pool per Celery queue, so a long session on one queue never holds
+    # the threads another queue's jobs are waiting for.
+    with _executor_lock:
+        executor = _executors.get(queue)
+        if executor is None:
+            workers = getattr(settings, 'BACKGROUND_TASK_QUEUE_WORKERS', {}).get(queue)
+            executor = _executors[queue] = ThreadPoolExecutor(
+                max_workers=workers or getattr(settings, 'BACKGROUND_TASK_WORKERS', 2),
+                thread_name_prefix=f'electionapp-{queue}',
+            )
+        return executor
+
+
+def _run_in_thread(task, args):
+    close_old_connections()
+    try:
+        task(*args)
+    except Exception:
+        logger.exception("Background task %s failed", task.name)
+    finally:
+        close_old_connections()
+
+
+def submit(task, *args):
+    # Runs a Celery task on the broker, or on an in-process thread pool when
+    # BACKGROUND_TASK_BACKEND is 'thread' (deployments without Redis).
+    # Dispatch waits for the current transaction so workers see its rows.
+    if getattr(settings, 'BACKGROUND_TASK_BACKEND', 'celery') == 'celery':
+        transaction.on_commit(lambda: task.delay(*args))
+    else:
+        transaction.on_commit(lambda: _get_executor(_queue_for(task)).submit(_run_in_thread, task, args))
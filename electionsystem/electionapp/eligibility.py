@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _classe_values(classes):
+    # is_voter_allowed compares str(utilisateur.classe) against the criteria,
+    # so only entries that are the exact string form of an integer can match.
+    values = []
+    for classe in classes:
+        if isinstance(classe, str) and classe.lstrip('-').isdigit() and str(int(classe)) == classe:
+            values.append(int(classe))
+    return values
+
+
+def criteria_to_q(criteria, Utilisateur=None):
+    # SQL counterpart of Election.is_voter_allowed: an empty list means no
+    # restriction, and sport_type only constrains students practising SPORT.
+    # Migrations pass their historical Utilisateur model.
+    if Utilisateur is None:
+        from .models import Utilisateur
+
+    criteria = criteria or {}
+    q = Q()
+    if criteria.get('classe'):
+        q &= Q(classe__in=_classe_values(criteria['classe']))
+    if criteria.get('mention'):
+        q &= Q(mention__in=criteria['mention'])
+    activites = criteria.get('activite')
+    if activites:
+        q &= Q(pk__in=Utilisateur.activites.through.objects.filter(
+            activite__nom__in=activites
+        ).values('utilisateur_id'))
+        if 'SPORT' in activites and criteria.get('sport_type'):
+            practises_sport = Q(pk__in=Utilisateur.activites.through.objects.filter(
+                activite__nom='SPORT'
+            ).values('utilisateur_id'))
+            q &= ~practises_sport | Q(sport_type__in=criteria['sport_type'])
+    return q
+
+
+def eligible_voters(election):
+    from .models import Utilisateur
+    return Utilisateur.objects.filter(criteria_to_q(election.allowed_voter_criteria))
+
+
+def eligible_counts(elections, batch=False):
+    # {election_id: eligible voters} for a batch of elections. The conditional
+    # aggregate costs a pass over Utilisateur per election; for batch callers
+    # (exports, the admin list) past ELIGIBILITY_ENGINE_MIN_ELECTIONS loading
+    # every student once into the NumPy engine is cheaper. Student-facing
+    # requests never pay for that load.
+    from .models import Utilisateur
+    from .eligibility_engine import EligibilityEngine, np
+    if not elections:
+        return {}
+    if batch and np is not None and len(elections) >= getattr(settings, 'ELIGIBILITY_ENGINE_MIN_ELECTIONS', 10):
+        return EligibilityEngine.load().counts(elections)
+    counts = Utilisateur.objects.aggregate(**{
+        str(election.id): Count('pk', filter=criteria_to_q(election.allowed_voter_criteria))
+        for election in elections
+    })
+    return {int(election_id): count for election_id, count in counts.items()}
+
+
+def eligibility_rows(criteria):
+    # Normalized (critere, valeur) pairs for ElectionEligibility. sport_type rows
+    # are only kept when they actually constrain anyone, i.e. SPORT is required.
+    criteria = criteria or {}
+    rows = []
+    if criteria.get('classe'):
+        classes = _classe_values(criteria['classe'])
+        rows.extend(('classe', str(classe)) for classe in classes)
+        if not classes:
+            # Restricted to classes no student can have: a value that
+            # str(utilisateur.classe) never takes keeps the criterion closed.
+            rows.append(('classe', ''))
+    for critere in ('mention', 'activite'):
+        for valeur in criteria.get(critere) or []:
+            rows.append((critere, str(valeur)))
+    activites = criteria.get('activite') or []
+    if 'SPORT' in activites:
+        for valeur in criteria.get('sport_type') or []:
+            rows.append(('sport_type', str(valeur)))
+    return list(dict.fromkeys(rows))
+
+
+@transaction.atomic
+def sync_eligibility_rules(election):
+    # One transaction: between the delete and the insert an election would
+    # have no rules, i.e. be open to every student.
+    from .models import ElectionEligibility
+    ElectionEligibility.objects.filter(election=election).delete()
+    ElectionEligibility.objects.bulk_create([
+        ElectionEligibility(election=election, critere=critere, valeur=valeur)
+        for critere, valeur in eligibility_rows(election.allowed_voter_criteria)
+    ])
+
+
+def _criterion_allows(critere, valeurs):
+    from .models import ElectionEligibility
+    rules = ElectionEligibility.objects.filter(election=OuterRef('pk'), critere=critere)
+    return ~Exists(rules) | Exists(rules.filter(valeur__in=valeurs))
+
+
+def elections_for(utilisateur):
+    # Reverse lookup of Election.is_voter_allowed over the rules table: every
+    # criterion is either unrestricted for the election or matches the student.
+    from .models import Election
+    activite_noms = [activite.nom for activite in utilisateur.activites.all()]
+    condition = (
+        _criterion_allows('classe', [str(utilisateur.classe)])
+        & _criterion_allows('mention', [utilisateur.mention])
+        & _criterion_allows('activite', activite_noms)
+    )
+    if 'SPORT' in activite_noms:
+        condition &= _criterion_allows('sport_type', [utilisateur.sport_type])
+    return Election.objects.filter(condition)
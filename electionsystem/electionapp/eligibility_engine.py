@@ -0,0 +1,93 @@
+from .eligibility import _classe_values
+import logging
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is in the requirements
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Vectorized counterpart of criteria_to_q for batch questions ("eligible
+# voters of every election"): the students are loaded once into column arrays
+# (classe, mention and sport_type codes, an activites bit matrix) and each
+# election's criteria becomes a boolean mask over them.
+
+
+class EligibilityEngine:
+    def __init__(self, ids, classes, mentions, sport_types, activites, codes, activite_columns):
+        self.ids = ids
+        self.classes = classes
+        self.mentions = mentions
+        self.sport_types = sport_types
+        self.activites = activites
+        self.codes = codes
+        self.activite_columns = activite_columns
+
+    @classmethod
+    def load(cls, Utilisateur=None):
+        if Utilisateur is None:
+            from .models import Utilisateur
+        rows = list(Utilisateur.objects.order_by('pk').values_list('pk', 'classe', 'mention', 'sport_type'))
+        memberships = list(Utilisateur.activites.through.objects.values_list('utilisateur_id', 'activite__nom'))
+
+        # Strings become small integer codes; 0 stands for NULL and never matches.
+        codes = {}
+
+        def encode(value):
+            if value is None:
+                return 0
+            return codes.setdefault(value, len(codes) + 1)
+
+        count = len(rows)
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+        classes = np.fromiter((row[1] for row in rows), dtype=np.int64, count=count)
+        mentions = np.fromiter((encode(row[2]) for row in rows), dtype=np.int32, count=count)
+        sport_types = np.fromiter((encode(row[3]) for row in rows), dtype=np.int32, count=count)
+
+        activite_columns = {}
+        for _, nom in memberships:
+            activite_columns.setdefault(nom, len(activite_columns))
+        activites = np.zeros((count, len(activite_columns)), dtype=bool)
+        if memberships:
+            positions = np.searchsorted(ids, np.fromiter((m[0] for m in memberships), dtype=np.int64, count=len(memberships)))
+            columns = np.fromiter((activite_columns[m[1]] for m in memberships), dtype=np.intp, count=len(memberships))
+            activites[positions, columns] = True
+        return cls(ids, classes, mentions, sport_types, activites, codes, activite_columns)
+
+    def _codes_for(self, values):
+        return [self.codes[value] for value in values if isinstance(value, str) and value in self.codes]
+
+    def _has_any(self, noms):
+        columns = [self.activite_columns[nom] for nom in noms if nom in self.activite_columns]
+        if not columns:
+            return np.zeros(len(self.ids), dtype=bool)
+        return self.activites[:, columns].any(axis=1)
+
+    def mask(self, criteria):
+        # Same rules as criteria_to_q: an empty list means no restriction and
+        # sport_type only constrains students practising SPORT.
+        criteria = criteria or {}
+        mask = np.ones(len(self.ids), dtype=bool)
+        if criteria.get('classe'):
+            mask &= np.isin(self.classes, _classe_values(criteria['classe']))
+        if criteria.get('mention'):
+            mask &= np.isin(self.mentions, self._codes_for(criteria['mention']))
+        activites = criteria.get('activite')
+        if activites:
+            mask &= self._has_any(activites)
+            if 'SPORT' in activites and criteria.get('sport_type'):
+                mask &= ~self._has_any(['SPORT']) | np.isin(self.sport_types, self._codes_for(criteria['sport_type']))
+        return mask
+
+    def matrix(self, elections):
+        """elections × students boolean matrix, rows in the order given and
+        columns in the order of self.ids."""
+        matrix = np.empty((len(elections), len(self.ids)), dtype=bool)
+        for row, election in enumerate(elections):
+            matrix[row] = self.mask(election.allowed_voter_criteria)
+        return matrix
+
+    def counts(self, elections):
+        totals = self.matrix(elections).sum(axis=1)
+        return {election.id: int(total) for election, total in zip(elections, totals)}
@@ -0,0 +1,79 @@
+import csv
+import tempfile
+from django.db.models import Count, Q
+from django.http import FileResponse, StreamingHttpResponse
+from openpyxl import Workbook
+from .eligibility import eligible_counts
+from .models import Election, Utilisateur
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+EXPORT_CHUNK_SIZE = 2000
+
+USER_HEADERS = ['Nom', 'Prénom', 'Classe', 'Mention', 'Activités', 'Type de sport', 'Année universitaire']
+ELECTION_HEADERS = ['Nom', 'Date de début', 'Date de fin', 'Statut', 'Votants', 'Électeurs totaux']
+
+
+def user_rows():
+    classes = dict(Utilisateur.CLASSE_CHOICES)
+    mentions = dict(Utilisateur.MENTION_CHOICES)
+    utilisateurs = Utilisateur.objects.select_related('user').prefetch_related('activites').order_by('id')
+    for u in utilisateurs.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        activites = [activite.nom for activite in u.activites.all()]
+        yield [
+            u.nom,
+            u.user.username,
+            classes.get(u.classe, 'Inconnu'),
+            mentions.get(u.mention, 'Inconnu'),
+            ', '.join(activites) if activites else 'N/A',
+            u.sport_type or 'N/A',
+            u.annee_universitaire or 'N/A',
+        ]
+
+
+def election_rows():
+    elections = list(Election.objects.annotate(
+        voters_who_voted=Count('votes', filter=Q(votes__estNul=False))
+    ).order_by('id'))
+    totals = eligible_counts(elections, batch=True)
+    for e in elections:
+        yield [
+            e.nom,
+            e.startdate.strftime('%d/%m/%Y %H:%M'),
+            e.enddate.strftime('%d/%m/%Y %H:%M'),
+            e.statut,
+            e.voters_who_voted,
+            totals.get(e.id, 0),
+        ]
+
+
+def xlsx_response(title, headers, rows, filename):
+    # Write-only workbooks spill rows to a temp file as they are appended, and
+    # FileResponse streams the finished archive, so memory stays flat.
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    ws.append(headers)
+    for row in rows:
+        ws.append(row)
+    output = tempfile.TemporaryFile()
+    wb.save(output)
+    output.seek(0)
+    return FileResponse(output, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def csv_response(headers, rows, filename):
+    writer = csv.writer(_Echo())
+
+    def stream():
+        yield '\ufeff'
+        yield writer.writerow(headers)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(stream(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
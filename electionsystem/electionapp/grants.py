@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+GRANT_SALT = 'electionapp.biometric-grant'
+
+
+class InvalidGrant(Exception):
+    pass
+
+
+def _ttl():
+    return getattr(settings, 'BIOMETRIC_GRANT_TTL', 120)
+
+
+def mint_grant(session):
+    # Signed token for a successful verify session. It expires BIOMETRIC_GRANT_TTL
+    # seconds after the scan, however many times the session is polled.
+    expires = session.finished_at.timestamp() + _ttl()
+    if session.mode != 'verify' or session.statut != 'reussi' or expires <= timezone.now().timestamp():
+        return None
+    return signing.dumps({'u': session.utilisateur_id, 's': session.id, 'exp': expires}, salt=GRANT_SALT)
+
+
+def consume_grant(token, utilisateur):
+    # Checked on the vote path: a signature check plus one conditional UPDATE
+    # on the session row, no sensor access. The UPDATE makes each verify
+    # session spendable once across all workers; returns its id so a vote
+    # that fails can release_grant() it.
+    from .models import BiometricSession
+    try:
+        payload = signing.loads(token, salt=GRANT_SALT, max_age=_ttl())
+    except signing.BadSignature:
+        raise InvalidGrant("Vérification biométrique invalide ou expirée")
+    remaining = payload['exp'] - timezone.now().timestamp()
+    if remaining <= 0:
+        raise InvalidGrant("Vérification biométrique invalide ou expirée")
+    if payload['u'] != utilisateur.id:
+        raise InvalidGrant("Vérification biométrique d'un autre utilisateur")
+    spent = BiometricSession.objects.filter(
+        id=payload['s'], utilisateur_id=utilisateur.id, grant_used_at__isnull=True,
+    ).update(grant_used_at=timezone.now())
+    if not spent:
+        raise InvalidGrant("Vérification biométrique déjà utilisée")
+    logger.info("Biometric grant for session %s used by utilisateur %s", payload['s'], utilisateur.id)
+    return payload['s']
+
+
+def release_grant(session_id):
+    from .models import BiometricSession
+    BiometricSession.objects.filter(id=session_id).update(grant_used_at=None)
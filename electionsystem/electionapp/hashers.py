@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BootstrapPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    # Cheap hash for the initial matricule password only. It is never the
+    # preferred hasher, so Django re-hashes with the default one on the first
+    # successful login, and FirstLoginAPIView replaces the password anyway.
+    algorithm = 'pbkdf2_sha256_bootstrap'
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'BOOTSTRAP_PASSWORD_ITERATIONS', 1000)
+
+
+def make_bootstrap_password(password):
+    if getattr(settings, 'BOOTSTRAP_PASSWORD_HASHING', 'fast') == 'fast':
+        return make_password(password, hasher=BootstrapPBKDF2PasswordHasher.algorithm)
+    return make_password(password)
+
+
+def hash_bootstrap_passwords(passwords):
+    # Imports run inside Celery (prefork, daemonic) workers, which cannot
+    # start child processes, so hashing stays in the calling thread.
+    return [make_bootstrap_password(password) for password in passwords]
@@ -0,0 +1,172 @@
+import pandas as pd
+from django.contrib.auth.models import User
+from django.db import transaction
+from .models import Utilisateur, Activite
+from .hashers import hash_bootstrap_passwords
+from .user_context import invalidate_utilisateurs
+import logging
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ['matricule', 'nom', 'username', 'annee_universitaire', 'classe', 'mention', 'activites']
+ACTIVITE_NOMS = {choice[0] for choice in Activite.ACTIVITE_CHOICES}
+CLASSES = {choice[0] for choice in Utilisateur.CLASSE_CHOICES}
+MENTIONS = {choice[0] for choice in Utilisateur.MENTION_CHOICES}
+SPORT_TYPES = {choice[0] for choice in Utilisateur.SPORT_SUBCHOICES}
+
+
+def missing_columns(df):
+    return [col for col in REQUIRED_COLUMNS if col not in df.columns]
+
+
+def _text(series):
+    return series.astype(str).str.strip()
+
+
+def _parse_activites(value):
+    if pd.isna(value):
+        return []
+    noms = [activite.strip().upper() for activite in str(value).strip().split(',')]
+    return list(dict.fromkeys(nom for nom in noms if nom in ACTIVITE_NOMS))
+
+
+def prepare_rows(df):
+    # Column-wise normalisation and validation. Returns the clean frame and a
+    # list of {'row', 'matricule', 'error'} dicts for the rejected rows.
+    rows = pd.DataFrame({
+        'row': df.index + 2,
+        'matricule': _text(df['matricule']),
+        'nom': _text(df['nom']),
+        'username': _text(df['username']),
+        'annee_universitaire': _text(df['annee_universitaire']),
+        'classe': pd.to_numeric(df['classe'], errors='coerce'),
+        'mention': _text(df['mention']),
+        'activites': df['activites'].map(_parse_activites),
+        'sport_type': _text(df['sport_type']).where(df['sport_type'].notna(), None) if 'sport_type' in df.columns else None,
+    })
+    checks = [
+        (~(rows['matricule'].str.isdigit() & (rows['matricule'].str.len() == 4)), "Matricule invalide"),
+        (rows['classe'].isna() | (rows['classe'] % 1 != 0) | ~rows['classe'].isin(CLASSES), "Classe invalide"),
+        (~rows['mention'].isin(MENTIONS), "Mention invalide"),
+        (rows['sport_type'].notna() & ~rows['sport_type'].isin(SPORT_TYPES), "Type de sport invalide"),
+        (rows['username'].eq('') | df['username'].isna().values, "Username manquant"),
+        (rows.duplicated('matricule', keep='last'), "Matricule dupliqué dans le fichier"),
+    ]
+    rejected = pd.Series(False, index=rows.index)
+    errors = []
+    for mask, message in checks:
+        mask = mask & ~rejected
+        for row, matricule in zip(rows.loc[mask, 'row'], rows.loc[mask, 'matricule']):
+            errors.append({'row': int(row), 'matricule': matricule, 'error': message})
+        rejected |= mask
+    valid = rows[~rejected].copy()
+    valid['classe'] = valid['classe'].astype(int)
+    valid['sport_type'] = valid['sport_type'].astype(object).where(valid['sport_type'].notna(), None)
+    return valid, errors
+
+
+def _activite_ids(rows):
+    needed = set().union(*rows['activites']) if len(rows) else set()
+    existing = {activite.nom: activite.id for activite in Activite.objects.filter(nom__in=needed)}
+    missing = needed - set(existing)
+    if missing:
+        Activite.objects.bulk_create([Activite(nom=nom) for nom in missing], ignore_conflicts=True)
+        existing = {activite.nom: activite.id for activite in Activite.objects.filter(nom__in=needed)}
+    return existing
+
+
+def import_users(df, hash_passwords=None, chunk_size=None, progress=None):
+    # Without chunk_size the whole file is written in a single transaction.
+    # Background jobs pass a chunk_size so progress can be committed and
+    # reported between chunks; `progress(rows_processed, report)` is called
+    # after each one.
+    valid, errors = prepare_rows(df)
+    hash_passwords = hash_passwords or hash_bootstrap_passwords
+    report = {'created': 0, 'updated': 0, 'errors': errors}
+    rows_processed = len(errors)
+    chunk_size = chunk_size or max(len(valid), 1)
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid.iloc[start:start + chunk_size]
+        created, updated, chunk_errors = _import_chunk(chunk, hash_passwords)
+        report['created'] += created
+        report['updated'] += updated
+        errors.extend(chunk_errors)
+        rows_processed += len(chunk)
+        if progress:
+            progress(rows_processed, report)
+    errors.sort(key=lambda error: error['row'])
+    logger.info("Imported %s new users, updated %s users, %s rows rejected", report['created'], report['updated'], len(errors))
+    return report
+
+
+def _import_chunk(valid, hash_passwords):
+    errors = []
+    with transaction.atomic():
+        activite_ids = _activite_ids(valid)
+        existing = {
+            utilisateur.matricule: utilisateur
+            for utilisateur in Utilisateur.objects.select_related('user').filter(matricule__in=list(valid['matricule']))
+        }
+        taken_usernames = dict(User.objects.filter(username__in=list(valid['username'])).values_list('username', 'id'))
+
+        updated, to_create = [], []
+        for record in valid.to_dict('records'):
+            utilisateur = existing.get(record['matricule'])
+            owner = taken_usernames.get(record['username'])
+            if utilisateur is not None:
+                if owner is not None and owner != utilisateur.user_id:
+                    errors.append({'row': record['row'], 'matricule': record['matricule'], 'error': f"Username {record['username']} déjà utilisé"})
+                    continue
+                utilisateur.user.username = record['username']
+                taken_usernames[record['username']] = utilisateur.user_id
+                updated.append((utilisateur, record))
+            else:
+                if owner is not None:
+                    errors.append({'row': record['row'], 'matricule': record['matricule'], 'error': f"Username {record['username']} existe déjà"})
+                    continue
+                taken_usernames[record['username']] = 0
+                to_create.append(record)
+
+        for utilisateur, record in updated:
+            utilisateur.nom = record['nom']
+            utilisateur.annee_universitaire = record['annee_universitaire']
+            utilisateur.classe = record['classe']
+            utilisateur.mention = record['mention']
+            utilisateur.sport_type = record['sport_type']
+            utilisateur.is_first_login = True
+        User.objects.bulk_update([u.user for u, _ in updated], ['username'], batch_size=500)
+        Utilisateur.objects.bulk_update(
+            [u for u, _ in updated],
+            ['nom', 'annee_universitaire', 'classe', 'mention', 'sport_type', 'is_first_login'],
+            batch_size=500,
+        )
+
+        passwords = hash_passwords([record['matricule'] for record in to_create])
+        users = User.objects.bulk_create(
+            [User(username=record['username'], password=password) for record, password in zip(to_create, passwords)],
+            batch_size=500,
+        )
+        created = Utilisateur.objects.bulk_create([
+            Utilisateur(
+                user=user,
+                matricule=record['matricule'],
+                nom=record['nom'],
+                annee_universitaire=record['annee_universitaire'],
+                classe=record['classe'],
+                mention=record['mention'],
+                sport_type=record['sport_type'],
+                is_first_login=True,
+            )
+            for user, record in zip(users, to_create)
+        ], batch_size=500)
+
+        Through = Utilisateur.activites.through
+        Through.objects.filter(utilisateur_id__in=[u.id for u, _ in updated]).delete()
+        Through.objects.bulk_create([
+            Through(utilisateur_id=utilisateur.id, activite_id=activite_ids[nom])
+            for utilisateur, record in list(updated) + list(zip(created, to_create))
+            for nom in record['activites']
+        ], batch_size=1000)
+
+    invalidate_utilisateurs([utilisateur.user_id for utilisateur, _ in updated])
+    return len(created), len(updated), errors
@@ -0,0 +1,306 @@
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, make_password
+from django.db import close_old_connections
+from django.utils.crypto import salted_hmac
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Login pipeline for the opening rush: password hashing runs on a bounded
+# thread pool (PBKDF2 releases the GIL), recently verified credentials skip
+# the hash entirely, and token buckets per client IP and per username+IP cap how
+# fast anyone can retry. The request thread still waits for its hash, so the
+# pool bounds CPU use, not worker occupancy; the API login views answer 503
+# up front once LOGIN_QUEUE_SIZE checks are waiting. All state is per-process.
+
+
+class LoginBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Trop de connexions en cours, réessayez dans un instant."
+    default_code = 'login_busy'
+    wait = 1
+
+
+class PoolFull(Exception):
+    pass
+
+
+class LoginPool:
+    def __init__(self, workers, max_pending, window=1000):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='electionapp-login')
+        # Deferred work gets its own thread so it never queues ahead of a login.
+        self.background = ThreadPoolExecutor(max_workers=1, thread_name_prefix='electionapp-login-deferred')
+        self.workers = workers
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.deferred = 0
+        self.latencies = deque(maxlen=window)
+        self.counters = Counter()
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _call(self, fn, args):
+        with self.lock:
+            self.running += 1
+        try:
+            return fn(*args)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    def _done(self, started):
+        with self.lock:
+            self.pending -= 1
+            self.counters['completed'] += 1
+            self.latencies.append(time.monotonic() - started)
+
+    def _deferred_done(self):
+        with self.lock:
+            self.deferred -= 1
+            self.counters['deferred'] += 1
+
+    def saturated(self):
+        with self.lock:
+            return self.pending >= self.max_pending
+
+    def run(self, fn, *args):
+        with self.lock:
+            if self.pending >= self.max_pending:
+                raise PoolFull()
+            self.pending += 1
+        started = time.monotonic()
+        future = self.executor.submit(self._call, fn, args)
+        future.add_done_callback(lambda _: self._done(started))
+        return future.result()
+
+    def defer(self, fn, *args):
+        # Fire-and-forget work; dropped (and retried on a later login) when
+        # the deferred backlog is already as long as the worker count.
+        with self.lock:
+            if self.deferred >= self.workers:
+                return False
+            self.deferred += 1
+        self.background.submit(fn, *args).add_done_callback(lambda _: self._deferred_done())
+        return True
+
+    def stats(self):
+        with self.lock:
+            ordered = sorted(self.latencies)
+            counters = dict(self.counters)
+            pending, running = self.pending, self.running
+
+        def percentile(p):
+            if not ordered:
+                return None
+            return round(ordered[max(math.ceil(p * len(ordered)) - 1, 0)] * 1000, 1)
+
+        return {
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'in_flight': pending,
+            'queue_depth': max(pending - running, 0),
+            'latency_ms': {'p50': percentile(0.5), 'p95': percentile(0.95), 'max': percentile(1.0)},
+            'samples': len(ordered),
+            **{name: counters.get(name, 0) for name in ('completed', 'rejected', 'inline', 'cache_hits', 'throttled', 'deferred')},
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_login_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = getattr(settings, 'LOGIN_HASH_WORKERS', None) or os.cpu_count() or 1
+            _pool = LoginPool(workers, getattr(settings, 'LOGIN_QUEUE_SIZE', 64))
+        return _pool
+
+
+# Successful verifications, keyed by an HMAC of the stored hash and the
+# submitted password: a changed password changes the key, and nothing here can
+# be turned back into a password without SECRET_KEY.
+_verified = {}
+_verified_lock = threading.Lock()
+
+
+def _credential_key(encoded, password):
+    return salted_hmac('electionapp.login-cache', f"{encoded}\0{password}", algorithm='sha256').digest()
+
+
+def _recently_verified(encoded, password):
+    with _verified_lock:
+        expires = _verified.get(_credential_key(encoded, password))
+    return expires is not None and expires > time.monotonic()
+
+
+def _remember(encoded, password):
+    ttl = getattr(settings, 'LOGIN_CREDENTIAL_CACHE_TTL', 0)
+    if not ttl:
+        return
+    with _verified_lock:
+        if len(_verified) >= getattr(settings, 'LOGIN_CREDENTIAL_CACHE_SIZE', 10000):
+            _verified.clear()
+        _verified[_credential_key(encoded, password)] = time.monotonic() + ttl
+
+
+def _verify(password, encoded):
+    must_update = []
+    is_correct = check_password(password, encoded, setter=must_update.append)
+    return is_correct, bool(must_update)
+
+
+def _upgrade_password(user_id, encoded, password):
+    # A hash flagged for upgrade (e.g. the bootstrap hasher) is re-hashed off
+    # the login path, so a first login only pays for the cheap check.
+    close_old_connections()
+    try:
+        get_user_model()._default_manager.filter(pk=user_id, password=encoded).update(password=make_password(password))
+    except Exception:
+        logger.exception("Password upgrade for user %s failed", user_id)
+    finally:
+        close_old_connections()
+
+
+def _hash(pool, fn, *args):
+    try:
+        return pool.run(fn, *args)
+    except PoolFull:
+        # Only callers that skipped LoginRateThrottle (the admin login, a
+        # race past the check) get here; they hash on their own thread
+        # rather than fail.
+        pool.count('inline')
+        return fn(*args)
+
+
+class PooledModelBackend(ModelBackend):
+    """ModelBackend whose password checks go through the login pool.
+
+    Never raises: load shedding belongs to the API views (LoginRateThrottle),
+    since Django's own login forms cannot turn an exception into a 503.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+        pool = get_login_pool()
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Same hashing cost as for an existing user (Django #20760).
+            _hash(pool, make_password, password)
+            return
+        if _recently_verified(user.password, password):
+            pool.count('cache_hits')
+        else:
+            is_correct, must_update = _hash(pool, _verify, password, user.password)
+            if not is_correct:
+                return
+            if must_update:
+                pool.defer(_upgrade_password, user.pk, user.password, password)
+            _remember(user.password, password)
+        if self.user_can_authenticate(user):
+            return user
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, capacity, now):
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, capacity, rate, now):
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / rate
+
+
+_buckets = OrderedDict()
+_buckets_lock = threading.Lock()
+
+
+def client_ip(request):
+    """REMOTE_ADDR, or the address LOGIN_NUM_PROXIES trusted proxies saw.
+
+    X-Forwarded-For is only read when proxies are configured, otherwise any
+    client could pick the IP its attempts are counted against.
+    """
+    num_proxies = getattr(settings, 'LOGIN_NUM_PROXIES', 0)
+    xff = request.META.get('HTTP_X_FORWARDED_FOR')
+    if num_proxies and xff:
+        addrs = [addr.strip() for addr in xff.split(',')]
+        return addrs[-min(num_proxies, len(addrs))]
+    return request.META.get('REMOTE_ADDR')
+
+
+class LoginRateThrottle(BaseThrottle):
+    """Token buckets per client IP and per submitted username from that IP.
+
+    The IP bucket is sized for a classroom behind one NAT; the username bucket
+    only allows a handful of attempts before slowing to the refill rate. It is
+    keyed on the IP too, so guessing someone's password from elsewhere does
+    not lock them out. Past LOGIN_THROTTLE_MAX_KEYS buckets the least recently
+    used ones are dropped. When the login pool is already full the request is
+    refused with LoginBusy before any bucket is charged.
+    """
+
+    def get_limits(self, request):
+        ip = client_ip(request)
+        limits = [('ip', ip, getattr(settings, 'LOGIN_THROTTLE_IP', (300, 10)))]
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if username:
+            limits.append(('username', (str(username).lower(), ip), getattr(settings, 'LOGIN_THROTTLE_USERNAME', (5, 0.2))))
+        return limits
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        pool = get_login_pool()
+        if pool.saturated():
+            pool.count('rejected')
+            raise LoginBusy()
+        now = time.monotonic()
+        max_keys = getattr(settings, 'LOGIN_THROTTLE_MAX_KEYS', 100000)
+        with _buckets_lock:
+            for scope, ident, (capacity, rate) in self.get_limits(request):
+                bucket = _buckets.get((scope, ident))
+                if bucket is None:
+                    bucket = _buckets[(scope, ident)] = TokenBucket(capacity, now)
+                    while len(_buckets) > max_keys:
+                        _buckets.popitem(last=False)
+                else:
+                    _buckets.move_to_end((scope, ident))
+                wait = bucket.take(capacity, rate, now)
+                if wait:
+                    self.retry_after = wait
+                    break
+        if self.retry_after is not None:
+            pool.count('throttled')
+            logger.info("Login throttled (%s %s)", scope, ident)
+            return False
+        return True
+
+    def wait(self):
+        return self.retry_after
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from electionapp.tallies import rebuild_tallies, verify_tallies
+
+
+class Command(BaseCommand):
+    help = "Rebuild ElectionTally/CandidateTally counters from Vote rows and verify them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--election', type=int, action='append', dest='elections',
+                            help="Restrict to this election id (repeatable)")
+        parser.add_argument('--check', action='store_true',
+                            help="Only verify the stored counters, do not rebuild them")
+
+    def handle(self, *args, **options):
+        election_ids = options['elections']
+        if not options['check']:
+            per_election, per_candidate = rebuild_tallies(election_ids)
+            self.stdout.write(f"Rebuilt {len(per_election)} election and {len(per_candidate)} candidate tallies")
+        mismatches = verify_tallies(election_ids)
+        for kind, key, expected, actual in mismatches:
+            self.stderr.write(f"{kind} {key}: expected {expected}, stored {actual}")
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} tally mismatches")
+        self.stdout.write(self.style.SUCCESS("Tallies match Vote rows"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from electionapp.scheduler import TransitionScheduler
+
+
+class Command(BaseCommand):
+    help = "Open and close elections on schedule (BACKGROUND_TASK_BACKEND=thread; Celery deployments use beat)"
+
+    def handle(self, *args, **options):
+        scheduler = TransitionScheduler()
+        self.stdout.write("Election scheduler running")
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            scheduler.stop()
@@ -0,0 +1,52 @@
+from django.conf import settings
+from .query_inspector import QueryInspector, QueryBudgetExceeded
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware:
+    """Record per-request query count, DB time and duplicated SQL.
+
+    Views opt into a budget with a ``query_budget`` class attribute, either an int
+    or a dict keyed by HTTP method. Overruns are logged, and raise
+    ``QueryBudgetExceeded`` when ``QUERY_BUDGET_STRICT`` is set so that tests fail.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_INSPECTOR_ENABLED', False):
+            return self.get_response(request)
+        inspector = QueryInspector()
+        request.query_budget = None
+        with inspector.capture():
+            response = self.get_response(request)
+        duplicates = inspector.duplicates()
+        response['X-DB-Query-Count'] = str(inspector.count)
+        response['X-DB-Time-Ms'] = str(inspector.duration_ms)
+        response['X-DB-Duplicate-Queries'] = str(sum(duplicates.values()) - len(duplicates))
+        logger.info("db queries", extra={
+            'path': request.path,
+            'method': request.method,
+            'status': response.status_code,
+            'db_query_count': inspector.count,
+            'db_time_ms': inspector.duration_ms,
+            'db_duplicates': duplicates,
+            'query_budget': request.query_budget,
+        })
+        budget = request.query_budget
+        if budget is not None and inspector.count > budget:
+            error = QueryBudgetExceeded(f"{request.method} {request.path}", budget, inspector)
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise error
+            logger.warning(str(error))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+        budget = getattr(view_class, 'query_budget', None)
+        if isinstance(budget, dict):
+            budget = budget.get(request.method)
+        request.query_budget = budget
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def _classe_values(classes):
+    # Frozen copy of eligibility._classe_values: migrations must not depend
+    # on app code that may change later.
+    values = []
+    for classe in classes:
+        if isinstance(classe, str) and classe.lstrip('-').isdigit() and str(int(classe)) == classe:
+            values.append(int(classe))
+    return values
+
+
+def _eligibility_rows(criteria):
+    # Frozen copy of eligibility.eligibility_rows.
+    criteria = criteria or {}
+    rows = []
+    if criteria.get('classe'):
+        classes = _classe_values(criteria['classe'])
+        rows.extend(('classe', str(classe)) for classe in classes)
+        if not classes:
+            rows.append(('classe', ''))
+    for critere in ('mention', 'activite'):
+        for valeur in criteria.get(critere) or []:
+            rows.append((critere, str(valeur)))
+    if 'SPORT' in (criteria.get('activite') or []):
+        for valeur in criteria.get('sport_type') or []:
+            rows.append(('sport_type', str(valeur)))
+    return list(dict.fromkeys(rows))
+
+
+def backfill_eligibility_rules(apps, schema_editor):
+    Election = apps.get_model('electionapp', 'Election')
+    ElectionEligibility = apps.get_model('electionapp', 'ElectionEligibility')
+    ElectionEligibility.objects.bulk_create([
+        ElectionEligibility(election=election, critere=critere, valeur=valeur)
+        for election in Election.objects.all()
+        for critere, valeur in _eligibility_rows(election.allowed_voter_criteria)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electionapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ElectionEligibility',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('critere', models.CharField(choices=[('classe', 'classe'), ('mention', 'mention'), ('activite', 'activite'), ('sport_type', 'sport_type')], max_length=20)),
+                ('valeur', models.CharField(max_length=20)),
+                ('election', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eligibility_rules', to='electionapp.election')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['election', 'critere', 'valeur'], name='electionapp_electio_6c80ee_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_eligibility_rules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_tallies(apps, schema_editor):
+    Vote = apps.get_model('electionapp', 'Vote')
+    ElectionTally = apps.get_model('electionapp', 'ElectionTally')
+    CandidateTally = apps.get_model('electionapp', 'CandidateTally')
+    rows = Vote.objects.filter(estNul=False).values('election_id', 'choix_id').annotate(total=Count('id'))
+    per_election = {}
+    candidate_tallies = []
+    for row in rows:
+        per_election[row['election_id']] = per_election.get(row['election_id'], 0) + row['total']
+        candidate_tallies.append(CandidateTally(election_id=row['election_id'], candidat_id=row['choix_id'], vote_count=row['total']))
+    CandidateTally.objects.bulk_create(candidate_tallies)
+    ElectionTally.objects.bulk_create([
+        ElectionTally(election_id=election_id, vote_count=total) for election_id, total in per_election.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electionapp', '0002_electioneligibility'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ElectionTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vote_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('election', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tally', to='electionapp.election')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CandidateTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vote_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('candidat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tallies', to='electionapp.utilisateur')),
+                ('election', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candidate_tallies', to='electionapp.election')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('election', 'candidat'), name='unique_candidate_tally')],
+            },
+        ),
+        migrations.RunPython(backfill_tallies, migrations.RunPython.noop),
+    ]
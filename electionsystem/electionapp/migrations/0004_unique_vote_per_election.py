@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:30
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicate_votes(apps, schema_editor):
+    # The old read-then-write vote path could store several ballots for the
+    # same (electeur, election); keep the earliest one so the constraint can
+    # be added, then recount the affected elections.
+    Vote = apps.get_model('electionapp', 'Vote')
+    ElectionTally = apps.get_model('electionapp', 'ElectionTally')
+    CandidateTally = apps.get_model('electionapp', 'CandidateTally')
+    duplicates = Vote.objects.values('electeur_id', 'election_id').annotate(total=Count('id')).filter(total__gt=1).order_by()
+    election_ids = set()
+    for row in duplicates:
+        ballots = Vote.objects.filter(electeur_id=row['electeur_id'], election_id=row['election_id']).order_by('created_at', 'id')
+        keep = ballots.values_list('id', flat=True)[0]
+        ballots.exclude(id=keep).delete()
+        election_ids.add(row['election_id'])
+    if not election_ids:
+        return
+
+    ElectionTally.objects.filter(election_id__in=election_ids).delete()
+    CandidateTally.objects.filter(election_id__in=election_ids).delete()
+    rows = (
+        Vote.objects.filter(election_id__in=election_ids, estNul=False)
+        .values('election_id', 'choix_id').annotate(total=Count('id')).order_by()
+    )
+    per_election = {}
+    candidate_tallies = []
+    for row in rows:
+        per_election[row['election_id']] = per_election.get(row['election_id'], 0) + row['total']
+        candidate_tallies.append(CandidateTally(election_id=row['election_id'], candidat_id=row['choix_id'], vote_count=row['total']))
+    CandidateTally.objects.bulk_create(candidate_tallies)
+    ElectionTally.objects.bulk_create([
+        ElectionTally(election_id=election_id, vote_count=total) for election_id, total in per_election.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electionapp', '0003_tallies'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_votes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('electeur', 'election'), name='unique_vote_per_election'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electionapp', '0005_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BiometricSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.CharField(choices=[('enroll', 'enroll'), ('verify', 'verify')], max_length=10)),
+                ('statut', models.CharField(choices=[('en_attente', 'en attente'), ('en_cours', 'en cours'), ('reussi', 'réussi'), ('echec', 'échec')], default='en_attente', max_length=20)),
+                ('password', models.CharField(blank=True, max_length=128)),
+                ('fingerprint_id', models.CharField(blank=True, max_length=10, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('utilisateur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='biometric_sessions', to='electionapp.utilisateur')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electionapp', '0006_biometricsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='biometricsession',
+            name='booth',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='biometricsession',
+            name='sensor',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:51
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_upcoming(apps, schema_editor):
+    Election = apps.get_model('electionapp', 'Election')
+    Election.objects.filter(statut='ouvert', startdate__gt=timezone.now()).update(statut='a_venir')
+
+
+def unmark_upcoming(apps, schema_editor):
+    Election = apps.get_model('electionapp', 'Election')
+    Election.objects.filter(statut='a_venir').update(statut='ouvert')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electionapp', '0007_biometricsession_booth'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='election',
+            name='statut',
+            field=models.CharField(choices=[('a_venir', 'à venir'), ('ouvert', 'ouvert'), ('ferme', 'ferme')], default='ouvert', max_length=50),
+        ),
+        migrations.RunPython(mark_upcoming, unmark_upcoming),
+    ]
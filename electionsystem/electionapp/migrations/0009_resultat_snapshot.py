@@ -0,0 +1,110 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:02
+
+import hashlib
+import json
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.utils import timezone
+
+
+def _classe_values(classes):
+    # Frozen copy of eligibility._classe_values: migrations must not depend
+    # on app code that may change later.
+    values = []
+    for classe in classes:
+        if isinstance(classe, str) and classe.lstrip('-').isdigit() and str(int(classe)) == classe:
+            values.append(int(classe))
+    return values
+
+
+def _criteria_to_q(criteria, Utilisateur):
+    # Frozen copy of eligibility.criteria_to_q.
+    criteria = criteria or {}
+    q = Q()
+    if criteria.get('classe'):
+        q &= Q(classe__in=_classe_values(criteria['classe']))
+    if criteria.get('mention'):
+        q &= Q(mention__in=criteria['mention'])
+    activites = criteria.get('activite')
+    if activites:
+        memberships = Utilisateur.activites.through.objects
+        q &= Q(pk__in=memberships.filter(activite__nom__in=activites).values('utilisateur_id'))
+        if 'SPORT' in activites and criteria.get('sport_type'):
+            practises_sport = Q(pk__in=memberships.filter(activite__nom='SPORT').values('utilisateur_id'))
+            q &= ~practises_sport | Q(sport_type__in=criteria['sport_type'])
+    return q
+
+
+def snapshot_results(apps, schema_editor):
+    # Freeze already published results from their listeVote rows before the
+    # M2M table is dropped.
+    Resultat = apps.get_model('electionapp', 'Resultat')
+    Utilisateur = apps.get_model('electionapp', 'Utilisateur')
+    for result in Resultat.objects.select_related('election__listeCandidats'):
+        election = result.election
+        counts = dict(
+            result.listeVote.filter(estNul=False).values_list('choix_id').annotate(total=Count('id')).order_by()
+        )
+        candidats = election.listeCandidats.candidats.order_by('id') if election.listeCandidats_id else []
+        result.candidate_counts = [
+            {'candidat_id': candidat.id, 'nom': candidat.nom, 'vote_count': counts.get(candidat.id, 0)}
+            for candidat in candidats
+        ]
+        result.results = {}
+        for entry in result.candidate_counts:
+            if entry['vote_count']:
+                result.results[entry['nom']] = result.results.get(entry['nom'], 0) + entry['vote_count']
+        result.total_voters = Utilisateur.objects.filter(_criteria_to_q(election.allowed_voter_criteria, Utilisateur)).count()
+        result.voters_who_voted = sum(counts.values())
+        result.published_at = result.updated_at or timezone.now()
+        payload = json.dumps(
+            [election.id, result.candidate_counts, result.total_voters, result.voters_who_voted],
+            sort_keys=True, separators=(',', ':'),
+        )
+        result.checksum = hashlib.sha256(payload.encode()).hexdigest()
+        result.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electionapp', '0008_election_a_venir'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resultat',
+            name='candidate_counts',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='resultat',
+            name='checksum',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='resultat',
+            name='published_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='resultat',
+            name='results',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name='resultat',
+            name='total_voters',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='resultat',
+            name='voters_who_voted',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(snapshot_results, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='resultat',
+            name='listeVote',
+        ),
+    ]
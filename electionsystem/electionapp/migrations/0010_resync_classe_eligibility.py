@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:45
+
+from django.db import migrations
+
+
+def _classe_values(classes):
+    # Frozen copy of eligibility._classe_values: migrations must not depend
+    # on app code that may change later.
+    values = []
+    for classe in classes:
+        if isinstance(classe, str) and classe.lstrip('-').isdigit() and str(int(classe)) == classe:
+            values.append(int(classe))
+    return values
+
+
+def _eligibility_rows(criteria):
+    # Frozen copy of eligibility.eligibility_rows.
+    criteria = criteria or {}
+    rows = []
+    if criteria.get('classe'):
+        classes = _classe_values(criteria['classe'])
+        rows.extend(('classe', str(classe)) for classe in classes)
+        if not classes:
+            rows.append(('classe', ''))
+    for critere in ('mention', 'activite'):
+        for valeur in criteria.get(critere) or []:
+            rows.append((critere, str(valeur)))
+    if 'SPORT' in (criteria.get('activite') or []):
+        for valeur in criteria.get('sport_type') or []:
+            rows.append(('sport_type', str(valeur)))
+    return list(dict.fromkeys(rows))
+
+
+def resync_classe_rules(apps, schema_editor):
+    # Rules written before classe criteria were normalized like
+    # is_voter_allowed (e.g. [1] stored as '1').
+    Election = apps.get_model('electionapp', 'Election')
+    ElectionEligibility = apps.get_model('electionapp', 'ElectionEligibility')
+    ElectionEligibility.objects.filter(critere='classe').delete()
+    ElectionEligibility.objects.bulk_create([
+        ElectionEligibility(election=election, critere=critere, valeur=valeur)
+        for election in Election.objects.all()
+        for critere, valeur in _eligibility_rows(election.allowed_voter_criteria)
+        if critere == 'classe'
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electionapp', '0009_resultat_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(resync_classe_rules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electionapp', '0010_resync_classe_eligibility'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='biometricsession',
+            name='grant_used_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,8 +1,17 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .eligibility import eligible_voters, sync_eligibility_rules
+from .scheduler import expected_statut, schedule_election
+from .results_cache import invalidate_results
+from .user_context import invalidate_utilisateurs
+import hashlib
+import json
 import logging
 
-ELECTION_STATUS_CHOICES = (("ouvert", "ouvert"), ("ferme", "ferme"))
+ELECTION_STATUS_CHOICES = (("a_venir", "à venir"), ("ouvert", "ouvert"), ("ferme", "ferme"))
 logger = logging.getLogger(__name__)
 
 class Activite(models.Model):
@@ -37,17 +46,29 @@ class Utilisateur(models.Model):
     sport_type = models.CharField(max_length=10, choices=SPORT_SUBCHOICES, null=True, blank=True)
     is_first_login = models.BooleanField(default=True)
 
-    def voter(self, candidat, election):
-        if not self.has_voted(election):
-            vote = Vote.objects.create(electeur=self, choix=candidat, estNul=False, election=election)
-            return vote
-        raise ValueError("La personne a déjà voté dans cette élection")
+    def voter(self, candidat_id, election):
+        from .tallies import increment_tallies
+        # The unique (electeur, election) constraint rejects double submissions,
+        # so the ballot is a single insert instead of a has_voted() read first.
+        try:
+            with transaction.atomic():
+                is_candidate = ListeCandidats.candidats.through.objects.filter(
+                    listecandidats_id=election.listeCandidats_id, utilisateur_id=candidat_id
+                ).exists()
+                if not is_candidate:
+                    raise ValueError("Candidat non valide pour cette élection")
+                vote = Vote.objects.create(electeur=self, choix_id=candidat_id, estNul=False, election=election)
+                increment_tallies(election.id, candidat_id)
+        except IntegrityError:
+            raise ValueError("La personne a déjà voté dans cette élection")
+        return vote
 
     def has_voted(self, election):
         return Vote.objects.filter(electeur=self, election=election).exists()
 
     def get_vote_count(self, election):
-        return Vote.objects.filter(choix=self, election=election, estNul=False).count()
+        tally = CandidateTally.objects.filter(candidat=self, election=election).values_list('vote_count', flat=True).first()
+        return tally or 0
 
     def __str__(self):
         return self.nom
@@ -61,10 +82,13 @@ class Vote(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def enregistrerVote(self):
-        if self.choix in self.election.listeCandidats.candidats.all():
+        if self.election.listeCandidats and self.election.listeCandidats.candidats.filter(id=self.choix_id).exists():
             self.estNul = False
         self.save()
 
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['electeur', 'election'], name='unique_vote_per_election')]
+
 class ListeCandidats(models.Model):
     nom = models.CharField(max_length=100)
     candidats = models.ManyToManyField(Utilisateur)
@@ -81,6 +105,20 @@ class Election(models.Model):
     allowed_voter_criteria = models.JSONField(default=dict)
     resultat = models.OneToOneField('Resultat', on_delete=models.CASCADE, null=True, blank=True, related_name='related_election')
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and self.statut in ('a_venir', 'ouvert') and timezone.now() <= self.enddate:
+            # Closing is left to the scheduler so results get materialized.
+            self.statut = expected_statut(self)
+        with transaction.atomic():
+            # A new election must not be visible before its rules exist.
+            super().save(*args, **kwargs)
+            if update_fields is None or 'allowed_voter_criteria' in update_fields:
+                sync_eligibility_rules(self)
+        if update_fields is None or {'startdate', 'enddate'} & set(update_fields):
+            schedule_election(self)
+        invalidate_results(self.id)
+
     def is_open(self):
         from django.utils import timezone
         return self.statut == "ouvert" and timezone.now() <= self.enddate
@@ -88,18 +126,22 @@ class Election(models.Model):
     def is_voter_allowed(self, utilisateur):
         criteria = self.allowed_voter_criteria or {}
         user_classe = str(utilisateur.classe)
-        logger.info(f"Checking is_voter_allowed for user classe={user_classe}, criteria={criteria}")
+        logger.debug("Checking is_voter_allowed for user classe=%s, criteria=%s", user_classe, criteria)
         classe_allowed = not criteria.get('classe') or len(criteria.get('classe', [])) == 0 or user_classe in criteria.get('classe', [])
         mention_allowed = not criteria.get('mention') or len(criteria.get('mention', [])) == 0 or utilisateur.mention in criteria.get('mention', [])
-        activite_allowed = not criteria.get('activite') or len(criteria.get('activite', [])) == 0 or any(activite.nom in criteria.get('activite', []) for activite in utilisateur.activites.all())
+        activite_noms = {activite.nom for activite in utilisateur.activites.all()} if criteria.get('activite') else set()
+        activite_allowed = not criteria.get('activite') or len(criteria.get('activite', [])) == 0 or any(nom in criteria.get('activite', []) for nom in activite_noms)
         sport_type_allowed = True
         if criteria.get('activite') and 'SPORT' in criteria.get('activite', []) and criteria.get('sport_type'):
-            if any(activite.nom == 'SPORT' for activite in utilisateur.activites.all()):
+            if 'SPORT' in activite_noms:
                 sport_type_allowed = len(criteria.get('sport_type', [])) == 0 or utilisateur.sport_type in criteria.get('sport_type', [])
         allowed = classe_allowed and mention_allowed and activite_allowed and sport_type_allowed
-        logger.info(f"Result: classe_allowed={classe_allowed}, mention_allowed={mention_allowed}, activite_allowed={activite_allowed}, sport_type_allowed={sport_type_allowed}, allowed={allowed}")
+        logger.debug("Result: classe_allowed=%s, mention_allowed=%s, activite_allowed=%s, sport_type_allowed=%s, allowed=%s", classe_allowed, mention_allowed, activite_allowed, sport_type_allowed, allowed)
         return allowed
 
+    def eligible_voters(self):
+        return eligible_voters(self)
+
     def clean(self):
         if self.startdate > self.enddate:
             raise ValueError("Start date must be before end date")
@@ -107,17 +149,117 @@ class Election(models.Model):
     class Meta:
         indexes = [models.Index(fields=['startdate', 'enddate']), models.Index(fields=['statut'])]
 
+class ElectionEligibility(models.Model):
+    CRITERE_CHOICES = (
+        ('classe', 'classe'), ('mention', 'mention'), ('activite', 'activite'), ('sport_type', 'sport_type'),
+    )
+    election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='eligibility_rules')
+    critere = models.CharField(max_length=20, choices=CRITERE_CHOICES)
+    valeur = models.CharField(max_length=20)
+
+    class Meta:
+        indexes = [models.Index(fields=['election', 'critere', 'valeur'])]
+
+class ElectionTally(models.Model):
+    election = models.OneToOneField(Election, on_delete=models.CASCADE, related_name='tally')
+    vote_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class CandidateTally(models.Model):
+    election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='candidate_tallies')
+    candidat = models.ForeignKey(Utilisateur, on_delete=models.CASCADE, related_name='tallies')
+    vote_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['election', 'candidat'], name='unique_candidate_tally')]
+
 class Resultat(models.Model):
+    # Immutable snapshot computed once at publication (see tallies.publish_results).
     election = models.ForeignKey('Election', on_delete=models.CASCADE, db_index=True, related_name='resultat_set')
-    listeVote = models.ManyToManyField('Vote')
+    candidate_counts = models.JSONField(default=list)
+    results = models.JSONField(default=dict)
+    total_voters = models.PositiveIntegerField(default=0)
+    voters_who_voted = models.PositiveIntegerField(default=0)
+    checksum = models.CharField(max_length=64, blank=True)
+    published_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def save(self, *args, **kwargs):
+        if self.pk and Resultat.objects.filter(pk=self.pk).exclude(checksum='').exists():
+            raise ValueError("Les résultats publiés ne peuvent pas être modifiés")
+        super().save(*args, **kwargs)
+
+    def turnout(self):
+        return self.voters_who_voted / self.total_voters if self.total_voters else 0.0
+
+    def compute_checksum(self):
+        payload = json.dumps(
+            [self.election_id, self.candidate_counts, self.total_voters, self.voters_who_voted],
+            sort_keys=True, separators=(',', ':'),
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def is_intact(self):
+        return bool(self.checksum) and self.checksum == self.compute_checksum()
+
     def calculerResultats(self):
-        votes = self.listeVote.all()
-        result = {}
-        for vote in votes:
-            if not vote.estNul:
-                candidate = vote.choix.nom
-                result[candidate] = result.get(candidate, 0) + 1
-        return result
\ No newline at end of file
+        return dict(self.results)
+
+class ImportJob(models.Model):
+    STATUT_CHOICES = (
+        ('en_attente', 'en attente'), ('en_cours', 'en cours'), ('termine', 'terminé'), ('echec', 'échec'),
+    )
+    file = models.FileField(upload_to='imports/')
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='en_attente')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    rows_total = models.PositiveIntegerField(default=0)
+    rows_processed = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def throughput(self):
+        from django.utils import timezone
+        if not self.started_at or not self.rows_processed:
+            return 0.0
+        elapsed = ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+        return round(self.rows_processed / elapsed, 1) if elapsed > 0 else float(self.rows_processed)
+
+class BiometricSession(models.Model):
+    MODE_CHOICES = (('enroll', 'enroll'), ('verify', 'verify'))
+    STATUT_CHOICES = (
+        ('en_attente', 'en attente'), ('en_cours', 'en cours'), ('reussi', 'réussi'), ('echec', 'échec'),
+    )
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES)
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='en_attente')
+    utilisateur = models.ForeignKey(Utilisateur, on_delete=models.CASCADE, related_name='biometric_sessions')
+    # Hashed new password for an enroll session, applied once enrollment succeeds.
+    password = models.CharField(max_length=128, blank=True)
+    fingerprint_id = models.CharField(max_length=10, null=True, blank=True)
+    # Booth the student is standing at; pins the scan to that booth's reader.
+    booth = models.CharField(max_length=50, blank=True)
+    sensor = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Set when the session's vote grant is spent (see grants.consume_grant).
+    grant_used_at = models.DateTimeField(null=True, blank=True)
+
+    def is_finished(self):
+        return self.statut in ('reussi', 'echec')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, created=False, update_fields=None, **kwargs):
+    # is_staff, is_active and the username travel in access tokens: moving
+    # profile_version on makes ClaimsJWTAuthentication reload the row.
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    invalidate_utilisateurs([instance.pk])
@@ -0,0 +1,68 @@
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from django.db import connections
+import logging
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    # Parameters are already split out by the DB API, so collapsing IN lists
+    # and whitespace is enough for N+1 loops to share a fingerprint.
+    return _IN_LIST.sub('IN (...)', _WHITESPACE.sub(' ', sql.strip()))
+
+
+class QueryInspector:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def duration_ms(self):
+        return round(self.duration * 1000, 2)
+
+    def duplicates(self):
+        return {sql: n for sql, n in self.fingerprints.most_common() if n > 1}
+
+    @contextmanager
+    def capture(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+
+class QueryBudgetExceeded(AssertionError):
+    def __init__(self, label, budget, inspector):
+        duplicates = '\n'.join(f"  {n}x {sql}" for sql, n in inspector.duplicates().items())
+        super().__init__(
+            f"{label} ran {inspector.count} queries (budget {budget}) in {inspector.duration_ms} ms"
+            + (f"\nDuplicated queries:\n{duplicates}" if duplicates else "")
+        )
+        self.inspector = inspector
+
+
+@contextmanager
+def assert_query_budget(budget, label='block'):
+    # Test helper: fails with the duplicated fingerprints when the wrapped
+    # block issues more than `budget` queries.
+    inspector = QueryInspector()
+    with inspector.capture():
+        yield inspector
+    if inspector.count > budget:
+        raise QueryBudgetExceeded(label, budget, inspector)
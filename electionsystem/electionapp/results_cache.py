@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+import time
+
+# Results payloads are cached per (election, version). Anything that changes
+# what /resultats/ returns bumps the version instead of deleting keys, so a
+# stale payload can never be served and old entries simply expire. Views only
+# rely on this with a SHARED_CACHE: a per-process version never sees the bumps
+# made by other workers.
+
+
+def _version_key(election_id):
+    return f"results-version:{election_id}"
+
+
+def results_version(election_id):
+    # Seeded from the clock so a version lost on eviction/restart never
+    # repeats an ETag a client may still hold.
+    return cache.get_or_set(_version_key(election_id), lambda: int(time.time() * 1000), timeout=None)
+
+
+def bump_results_version(election_id):
+    key = _version_key(election_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), timeout=None)
+
+
+def invalidate_results(election_id):
+    # Bump once the current transaction commits, so a reader can't cache a
+    # payload built from the pre-commit state under the new version.
+    transaction.on_commit(lambda: bump_results_version(election_id))
+
+
+def results_etag(election_id, version, user_id):
+    # The body differs per user only through election.can_vote, which can
+    # only change together with the version (vote cast, election closed).
+    return f'"results-{election_id}-{version}-{user_id}"'
+
+
+def get_cached_results(election_id, version):
+    return cache.get(f"results:{election_id}:{version}")
+
+
+def set_cached_results(election_id, version, data, published):
+    # Published results are frozen, so they can stay cached indefinitely.
+    timeout = None if published else getattr(settings, 'RESULTS_CACHE_TIMEOUT', 300)
+    cache.set(f"results:{election_id}:{version}", data, timeout=timeout)
@@ -0,0 +1,109 @@
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Min
+from django.utils import timezone
+from datetime import timedelta
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Election lifecycle: a_venir -> ouvert at startdate, ouvert -> ferme at enddate.
+# Transitions only move forward, so an election closed early (results
+# published) is never reopened.
+
+
+def expected_statut(election, now=None):
+    now = now or timezone.now()
+    if election.statut == 'ferme' or now > election.enddate:
+        return 'ferme'
+    if now < election.startdate:
+        return 'a_venir'
+    return 'ouvert'
+
+
+def materialize_results(election_id):
+    # Runs once per election, right after it closes: recount the tallies from
+    # the Vote table so the results read from them are exact.
+    from .tallies import rebuild_tallies
+    rebuild_tallies([election_id])
+    logger.info("Results materialized for election %s", election_id)
+
+
+def apply_transitions(now=None):
+    from .models import Election
+    from .results_cache import bump_results_version
+    now = now or timezone.now()
+    starting = list(Election.objects.filter(statut='a_venir', startdate__lte=now, enddate__gte=now).values_list('id', flat=True))
+    opened = Election.objects.filter(id__in=starting, statut='a_venir').update(statut='ouvert')
+    for election_id in starting:
+        bump_results_version(election_id)
+    closed = []
+    due = Election.objects.filter(statut__in=('a_venir', 'ouvert'), enddate__lt=now).values_list('id', flat=True)
+    for election_id in list(due):
+        # Conditional update: with several schedulers running, only one of
+        # them wins the transition and materializes the results.
+        if Election.objects.filter(id=election_id, statut__in=('a_venir', 'ouvert')).update(statut='ferme'):
+            closed.append(election_id)
+            materialize_results(election_id)
+            bump_results_version(election_id)
+    if opened or closed:
+        logger.info("%s: opened %s elections, closed %s elections", now, opened, len(closed))
+    return opened, closed
+
+
+def next_transition(now=None):
+    from .models import Election
+    now = now or timezone.now()
+    starts = Election.objects.filter(statut='a_venir', startdate__gt=now).aggregate(at=Min('startdate'))['at']
+    ends = Election.objects.filter(statut__in=('a_venir', 'ouvert'), enddate__gte=now).aggregate(at=Min('enddate'))['at']
+    upcoming = [at for at in (starts, ends) if at is not None]
+    return min(upcoming) if upcoming else None
+
+
+class TransitionScheduler:
+    """Scheduler for deployments without a Celery broker, run by the
+    run_scheduler management command (one per deployment).
+
+    It applies due transitions, then sleeps until the next startdate/enddate,
+    capped by ELECTION_SCHEDULER_MAX_SLEEP so that dates edited from the web
+    processes are picked up within that bound.
+    """
+
+    def __init__(self):
+        self.wakeup = threading.Event()
+        self.stopping = False
+
+    def stop(self):
+        self.stopping = True
+        self.wakeup.set()
+
+    def run(self):
+        max_sleep = getattr(settings, 'ELECTION_SCHEDULER_MAX_SLEEP', 60)
+        while not self.stopping:
+            self.wakeup.clear()
+            delay = max_sleep
+            close_old_connections()
+            try:
+                apply_transitions()
+                upcoming = next_transition()
+                if upcoming is not None:
+                    # enddate is inclusive (is_open uses <=): wake just after it.
+                    delay = min(max((upcoming - timezone.now()).total_seconds(), 0) + 0.01, max_sleep)
+            except Exception:
+                logger.exception("Election scheduler iteration failed")
+            finally:
+                close_old_connections()
+            self.wakeup.wait(delay)
+
+
+def schedule_election(election):
+    # Called after an election is saved. Celery gets one ETA task per upcoming
+    # transition (stale ones are harmless: apply_transitions re-reads the
+    # dates); run_scheduler notices the new dates on its next wake-up.
+    if getattr(settings, 'BACKGROUND_TASK_BACKEND', 'celery') == 'celery':
+        from .tasks import apply_election_transitions
+        now = timezone.now()
+        for at in (election.startdate, election.enddate):
+            if at >= now:
+                transaction.on_commit(lambda at=at: apply_election_transitions.apply_async(eta=at + timedelta(milliseconds=10)))
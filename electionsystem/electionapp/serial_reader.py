@@ -1,88 +1,274 @@
+import atexit
+from collections import namedtuple
+from contextlib import contextmanager
+import errno
 import serial
+import threading
 import time
+import logging
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
+SensorEvent = namedtuple('SensorEvent', ['kind', 'fingerprint_id', 'status', 'raw'])
+
+def parse_frame(line):
+    """Parse one line from the ESP8266 into a SensorEvent, or None.
+
+    Frames are ``ENROLL_SUCCESS:<id>:<status>``, ``VERIFY_SUCCESS:<id>:<status>``,
+    ``ENROLL_FAILED`` and ``VERIFY_FAILED``; anything else (debug output, the
+    echo of our own command) is ignored.
+    """
+    try:
+        decoded_line = line.decode('utf-8').strip()
+    except UnicodeDecodeError:
+        logger.warning("Decode error, Raw bytes: %r", line)
+        return None
+    if decoded_line.startswith(("ENROLL_SUCCESS:", "VERIFY_SUCCESS:")):
+        parts = decoded_line.split(":")
+        if len(parts) == 3:
+            return SensorEvent(parts[0], parts[1], parts[2], decoded_line)
+    elif decoded_line in ("ENROLL_FAILED", "VERIFY_FAILED"):
+        return SensorEvent(decoded_line, None, "FAILED", decoded_line)
+    return None
+
+class SensorOwnedElsewhere(serial.SerialException):
+    """The reader's port is already held by another process."""
+
+
+class UnknownBooth(ValueError):
+    """No reader is pinned to the requested booth."""
+
+
 class FingerprintReader:
-    def __init__(self, port='COM6', baudrate=115200):
-        print(f"Initializing FingerprintReader on {port} at {baudrate} baud")
-        self.ser = serial.Serial(port, baudrate, timeout=1)
-        self.ser.flushInput()  # Clear input buffer
-        self.ser.flushOutput()  # Clear output buffer
-        time.sleep(2)  # Wait for ESP8266 to initialize
-
-    def read_enroll(self):
-        print("Waiting for enroll data...")
-        start_time = time.time()
-        while time.time() - start_time < 30:  # 30-second timeout
-            if self.ser.in_waiting:
-                try:
-                    line = self.ser.readline()
-                    if line:
-                        try:
-                            decoded_line = line.decode('utf-8').strip()
-                            print(f"Received: {decoded_line}")
-                            if decoded_line.startswith("ENROLL_SUCCESS:"):
-                                parts = decoded_line.split(":")
-                                if len(parts) == 3:
-                                    id, status = parts[1], parts[2]
-                                    return id, status
-                            elif decoded_line == "ENROLL_FAILED":
-                                return None, "FAILED"
-                        except UnicodeDecodeError:
-                            print(f"Decode error in enroll, Raw bytes: {line}")
-                except serial.SerialException as e:
-                    raise serial.SerialException(f"Serial error: {str(e)}")
-            time.sleep(0.1)
-        print("Timeout: No enrollment response")
-        return None, "TIMEOUT"
-
-    def read_verify(self):
-        print("Waiting for verify data...")
-        start_time = time.time()
-        while time.time() - start_time < 15:  # 15-second timeout
-            if self.ser.in_waiting:
-                try:
-                    line = self.ser.readline()
-                    if line:
-                        try:
-                            decoded_line = line.decode('utf-8').strip()
-                            print(f"Received: {decoded_line}")
-                            if decoded_line.startswith("VERIFY_SUCCESS:"):
-                                parts = decoded_line.split(":")
-                                if len(parts) == 3:
-                                    id, status = parts[1], parts[2]
-                                    return id, status
-                            elif decoded_line == "VERIFY_FAILED":
-                                return None, "FAILED"
-                        except UnicodeDecodeError:
-                            print(f"Decode error in verify, Raw bytes: {line}")
-                except serial.SerialException as e:
-                    raise serial.SerialException(f"Serial error: {str(e)}")
-            time.sleep(0.1)
-        print("Timeout: No verification response")
-        return None, "TIMEOUT"
+    def __init__(self, port='COM6', baudrate=115200, warmup=2):
+        # serial_for_url accepts plain device names as well as URLs such as
+        # 'loop://' or 'socket://host:port', which tests and benchmarks use.
+        # The port is opened exclusively (flock on POSIX, the OS default on
+        # Windows): two processes writing ENROLL/VERIFY to the same reader
+        # would read each other's frames.
+        logger.info("Initializing FingerprintReader on %s at %s baud", port, baudrate)
+        try:
+            self.ser = serial.serial_for_url(port, baudrate, timeout=1, exclusive=True)
+        except serial.SerialException as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EACCES, errno.EBUSY):
+                raise SensorOwnedElsewhere(
+                    e.errno,
+                    f"Fingerprint sensor {port} is owned by another process; biometric "
+                    f"sessions must run in a single process (see BIOMETRIC_TASK_QUEUE)",
+                )
+            raise
+        self.ser.reset_input_buffer()
+        self.ser.reset_output_buffer()
+        if warmup:
+            time.sleep(warmup)  # Wait for ESP8266 to initialize
+
+    def read_event(self, operation, timeout):
+        # Blocks in readline() until a frame arrives or the deadline passes,
+        # so a response is seen as soon as its newline is received.
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning("Timeout: No %s response", operation.lower())
+                return SensorEvent('TIMEOUT', None, 'TIMEOUT', None)
+            self.ser.timeout = remaining
+            try:
+                line = self.ser.readline()
+            except serial.SerialException as e:
+                raise serial.SerialException(f"Serial error: {str(e)}")
+            if not line:
+                continue
+            event = parse_frame(line)
+            if event is not None and event.kind.startswith(operation):
+                logger.debug("Received: %s", event.raw)
+                return event
+
+    def read_enroll(self, timeout=30):
+        event = self.read_event('ENROLL', timeout)
+        return event.fingerprint_id, event.status
+
+    def read_verify(self, timeout=15):
+        event = self.read_event('VERIFY', timeout)
+        return event.fingerprint_id, event.status
 
     def send_command(self, command):
-        print(f"Sending command: {command.strip()}")
+        logger.debug("Sending command: %s", command.strip())
         self.ser.write((command + '\n').encode('utf-8'))
         self.ser.flush()
 
     def close(self):
-        print("Closing serial connection")
+        logger.info("Closing serial connection")
         if self.ser.is_open:
             self.ser.close()
 
-def get_fingerprint_from_sensor(mode='enroll', user_id=None):
-    reader = FingerprintReader()
-    try:
+class FingerprintSensor:
+    """Long-lived connection to one fingerprint reader.
+
+    The port is opened (and the ESP8266 start-up delay paid) once, access is
+    serialized with a lock, and a failed exchange drops the connection so the
+    next call reconnects. Usage and health counters feed SensorPool.stats().
+    """
+
+    def __init__(self, port=None, baudrate=None, booth=None):
+        self.port = port or getattr(settings, 'FINGERPRINT_SENSOR_PORT', 'COM6')
+        self.baudrate = baudrate or getattr(settings, 'FINGERPRINT_SENSOR_BAUDRATE', 115200)
+        self.booth = booth
+        self.reader = None
+        self.lock = threading.Lock()
+        self.in_use = False
+        self.healthy = True
+        self.sessions = 0
+        self.failures = 0
+        self.reconnects = 0
+        self.busy_seconds = 0.0
+        self.last_error = None
+        self.created_at = time.monotonic()
+
+    def _connect(self):
+        if self.reader is None or not self.reader.ser.is_open:
+            warmup = getattr(settings, 'FINGERPRINT_SENSOR_WARMUP', 2)
+            self.reader = FingerprintReader(self.port, self.baudrate, warmup=warmup)
+        return self.reader
+
+    def _disconnect(self):
+        if self.reader is not None:
+            try:
+                self.reader.close()
+            except serial.SerialException:
+                pass
+            self.reader = None
+
+    def _exchange(self, mode, user_id):
+        reader = self._connect()
+        reader.ser.reset_input_buffer()
         if mode == 'enroll' and user_id:
             reader.send_command(f"ENROLL:{user_id}")
-            id, status = reader.read_enroll()
-            return id if status == "OK" else None
+            event = reader.read_event('ENROLL', getattr(settings, 'FINGERPRINT_ENROLL_TIMEOUT', 30))
         elif mode == 'verify':
             reader.send_command("VERIFY")
-            id, status = reader.read_verify()
-            return id if status == "OK" else None
-        return None
-    finally:
-        reader.close()
\ No newline at end of file
+            event = reader.read_event('VERIFY', getattr(settings, 'FINGERPRINT_VERIFY_TIMEOUT', 15))
+        else:
+            return None
+        return event.fingerprint_id if event.status == "OK" else None
+
+    def scan(self, mode='enroll', user_id=None):
+        with self.lock:
+            start = time.monotonic()
+            self.sessions += 1
+            try:
+                result = self._exchange(mode, user_id)
+            except SensorOwnedElsewhere as e:
+                self.healthy = False
+                self.failures += 1
+                self.last_error = str(e)
+                raise
+            except (serial.SerialException, OSError) as e:
+                logger.warning("Sensor error on %s, reconnecting: %s", self.port, e)
+                self._disconnect()
+                self.reconnects += 1
+                # Retry once on a fresh connection; a second failure propagates.
+                try:
+                    result = self._exchange(mode, user_id)
+                except (serial.SerialException, OSError) as e:
+                    self._disconnect()
+                    self.healthy = False
+                    self.failures += 1
+                    self.last_error = str(e)
+                    raise
+            finally:
+                self.busy_seconds += time.monotonic() - start
+            self.healthy = True
+            return result
+
+    def stats(self):
+        uptime = time.monotonic() - self.created_at
+        return {
+            'port': self.port,
+            'booth': self.booth,
+            'in_use': self.in_use,
+            'healthy': self.healthy,
+            'connected': self.reader is not None,
+            'sessions': self.sessions,
+            'failures': self.failures,
+            'reconnects': self.reconnects,
+            'busy_seconds': round(self.busy_seconds, 2),
+            'utilization': round(self.busy_seconds / uptime, 4) if uptime > 0 else 0.0,
+            'last_error': self.last_error,
+        }
+
+    def close(self):
+        with self.lock:
+            self._disconnect()
+
+class SensorPool:
+    """Schedules scans across the readers configured in FINGERPRINT_SENSORS.
+
+    A scan pinned to a booth waits for that booth's reader(s) and never falls
+    back to another booth's, where someone else's finger may be; otherwise
+    the least-used idle reader is picked, preferring healthy ones.
+    """
+
+    def __init__(self, sensors):
+        self.sensors = sensors
+        self.condition = threading.Condition()
+
+    def booths(self):
+        return {sensor.booth for sensor in self.sensors if sensor.booth}
+
+    def _candidates(self, booth):
+        if not booth:
+            return self.sensors
+        pinned = [sensor for sensor in self.sensors if sensor.booth == booth]
+        if not pinned:
+            raise UnknownBooth(f"Aucun capteur pour le poste {booth}")
+        return pinned
+
+    @contextmanager
+    def acquire(self, booth=None, timeout=None):
+        timeout = timeout if timeout is not None else getattr(settings, 'FINGERPRINT_SENSOR_ACQUIRE_TIMEOUT', 60)
+        with self.condition:
+            candidates = self._candidates(booth)
+            idle = lambda: [sensor for sensor in candidates if not sensor.in_use]
+            if not self.condition.wait_for(idle, timeout=timeout):
+                raise serial.SerialException("No fingerprint sensor available")
+            sensor = min(idle(), key=lambda s: (not s.healthy, s.sessions))
+            sensor.in_use = True
+        try:
+            yield sensor
+        finally:
+            with self.condition:
+                sensor.in_use = False
+                self.condition.notify_all()
+
+    def scan(self, mode='enroll', user_id=None, booth=None):
+        with self.acquire(booth) as sensor:
+            return sensor.scan(mode=mode, user_id=user_id), sensor
+
+    def stats(self):
+        return [sensor.stats() for sensor in self.sensors]
+
+    def close(self):
+        for sensor in self.sensors:
+            sensor.close()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_sensor_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            configured = getattr(settings, 'FINGERPRINT_SENSORS', None) or [
+                {'port': getattr(settings, 'FINGERPRINT_SENSOR_PORT', 'COM6')}
+            ]
+            _pool = SensorPool([
+                FingerprintSensor(port=sensor['port'], baudrate=sensor.get('baudrate'), booth=sensor.get('booth'))
+                for sensor in configured
+            ])
+            atexit.register(_pool.close)
+        return _pool
+
+def get_fingerprint_from_sensor(mode='enroll', user_id=None, booth=None):
+    fingerprint_id, _ = get_sensor_pool().scan(mode=mode, user_id=user_id, booth=booth)
+    return fingerprint_id
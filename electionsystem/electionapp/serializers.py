@@ -1,5 +1,10 @@
 from rest_framework import serializers
-from .models import User, Election, Utilisateur, Vote, ListeCandidats, Activite
+from django.db import models
+from django.db.models import Count, Prefetch, Q
+from .models import User, Election, Utilisateur, Vote, ListeCandidats, Activite, CandidateTally, ImportJob, BiometricSession
+from .eligibility import criteria_to_q, eligible_counts
+from .hashers import make_bootstrap_password
+from .user_context import get_utilisateur, resolve_utilisateur, invalidate_utilisateur
 import logging
 logger = logging.getLogger(__name__)
 
@@ -64,6 +69,7 @@ class UtilisateurSerializer(serializers.ModelSerializer):
             instance.user.set_password(validated_data['password'])
         instance.user.save()
         instance.save()
+        invalidate_utilisateur(instance)
         return instance
 
 class UtilisateurCreateSerializer(serializers.Serializer):
@@ -82,9 +88,9 @@ class UtilisateurCreateSerializer(serializers.Serializer):
         return value
 
     def create(self, validated_data):
-        user = User.objects.create_user(
+        user = User.objects.create(
             username=validated_data['username'],
-            password=validated_data['matricule']
+            password=make_bootstrap_password(validated_data['matricule'])
         )
         utilisateur = Utilisateur.objects.create(
             nom=validated_data['nom'],
@@ -101,6 +107,21 @@ class UtilisateurCreateSerializer(serializers.Serializer):
             utilisateur.activites.set(Activite.objects.filter(id__in=activite_ids))
         return utilisateur
 
+class ImportJobSerializer(serializers.ModelSerializer):
+    throughput = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'statut', 'rows_total', 'rows_processed', 'created_count', 'updated_count',
+            'errors', 'error', 'throughput', 'created_at', 'started_at', 'finished_at'
+        ]
+
+class BiometricSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BiometricSession
+        fields = ['id', 'mode', 'statut', 'fingerprint_id', 'booth', 'sensor', 'error', 'created_at', 'finished_at']
+
 class ListeCandidatsSerializer(serializers.ModelSerializer):
     candidats = UtilisateurSerializer(many=True, read_only=True)
     candidate_ids = serializers.ListField(child=serializers.IntegerField(), write_only=True, required=False)
@@ -119,9 +140,52 @@ class ListeCandidatsSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        logger.info(f"Serializing ListeCandidats id={instance.id}, nom={instance.nom}, candidats_count={instance.candidats.count()}, candidats={[c['nom'] for c in representation['candidats']]}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Serializing ListeCandidats id=%s, nom=%s, candidats_count=%s, candidats=%s", instance.id, instance.nom,
+                len(representation['candidats']), [c['nom'] for c in representation['candidats']],
+            )
         return representation
 
+def build_election_context(elections, request):
+    # Everything ElectionSerializer's method fields need for a batch of
+    # elections, in a fixed number of queries regardless of how many
+    # elections or candidates there are.
+    election_ids = [election.id for election in elections]
+    voted_counts = Vote.objects.aggregate(**{
+        str(election.id): Count('pk', filter=Q(
+            election_id=election.id, estNul=False,
+            electeur__in=Utilisateur.objects.filter(criteria_to_q(election.allowed_voter_criteria)).values('pk'),
+        ))
+        for election in elections
+    }) if elections else {}
+    candidate_votes = {election_id: {} for election_id in election_ids}
+    for tally in CandidateTally.objects.filter(election_id__in=election_ids):
+        candidate_votes[tally.election_id][tally.candidat_id] = tally.vote_count
+    utilisateur = None
+    voted_election_ids = set()
+    user = request.user if request else None
+    if user is not None and not user.is_staff:
+        utilisateur = get_utilisateur(request)
+        if utilisateur is not None:
+            voted_election_ids = set(Vote.objects.filter(
+                electeur=utilisateur, election_id__in=election_ids
+            ).values_list('election_id', flat=True))
+    return {
+        'eligible_counts': eligible_counts(elections, batch=user is not None and user.is_staff),
+        'voted_counts': {int(k): v for k, v in voted_counts.items()},
+        'candidate_votes': candidate_votes,
+        'utilisateur': utilisateur,
+        'voted_election_ids': voted_election_ids,
+    }
+
+class ElectionListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        elections = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if 'eligible_counts' not in self.context:
+            self.context.update(build_election_context(elections, self.context.get('request')))
+        return super().to_representation(elections)
+
 class ElectionSerializer(serializers.ModelSerializer):
     listeCandidats_id = serializers.PrimaryKeyRelatedField(
         queryset=ListeCandidats.objects.all(), source='listeCandidats', write_only=True, allow_null=True
@@ -143,24 +207,46 @@ class ElectionSerializer(serializers.ModelSerializer):
             'listeCandidats', 'listeCandidats_id', 'allowed_voter_criteria',
             'candidate_votes', 'total_voters', 'voters_who_voted', 'can_vote'
         ]
+        list_serializer_class = ElectionListSerializer
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('listeCandidats', 'resultat').prefetch_related(
+            Prefetch('listeCandidats__candidats', queryset=Utilisateur.objects.select_related('user').prefetch_related('activites'))
+        )
 
     def get_candidate_votes(self, obj):
-        return {candidate.nom: candidate.get_vote_count(obj) for candidate in obj.listeCandidats.candidats.all()}
+        if 'candidate_votes' in self.context:
+            tallies = self.context['candidate_votes'].get(obj.id, {})
+        else:
+            tallies = dict(obj.candidate_tallies.values_list('candidat_id', 'vote_count'))
+        return {candidate.nom: tallies.get(candidate.id, 0) for candidate in obj.listeCandidats.candidats.all()}
 
     def get_total_voters(self, obj):
-        return len([u for u in Utilisateur.objects.all() if obj.is_voter_allowed(u)])
+        if 'eligible_counts' in self.context:
+            return self.context['eligible_counts'].get(obj.id, 0)
+        return obj.eligible_voters().count()
 
     def get_voters_who_voted(self, obj):
-        return obj.votes.filter(electeur__in=[
-            u for u in Utilisateur.objects.all() if obj.is_voter_allowed(u)
-        ], estNul=False).count()
+        if 'voted_counts' in self.context:
+            return self.context['voted_counts'].get(obj.id, 0)
+        return obj.votes.filter(electeur__in=obj.eligible_voters(), estNul=False).count()
 
     def get_can_vote(self, obj):
         user = self.context['request'].user
         if user.is_staff:
             return False
+        if 'utilisateur' in self.context:
+            utilisateur = self.context['utilisateur']
+            if utilisateur is None:
+                return False
+            return (
+                obj.is_voter_allowed(utilisateur) and
+                obj.id not in self.context['voted_election_ids'] and
+                obj.is_open()
+            )
         try:
-            utilisateur = Utilisateur.objects.get(user=user)
+            utilisateur = resolve_utilisateur(self.context['request'])
             return (
                 obj.is_voter_allowed(utilisateur) and
                 not utilisateur.has_voted(obj) and
@@ -0,0 +1,220 @@
+from django.conf import settings
+from django.core import signing
+from django.db import close_old_connections
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Live turnout/tally stream. Each watched election gets one broadcaster thread
+# that polls the results version (bumped on every vote, see results_cache) at
+# most RESULTS_STREAM_MAX_RATE times per second, recomputes the counts once
+# per change and fans the update out to every subscriber's event loop. Without
+# a SHARED_CACHE the version can't see votes taken by other workers, so the
+# thread polls a cheap fingerprint of the election row and its tally instead.
+#
+# Under ASGI a subscriber is an asyncio task and costs no thread. Under WSGI
+# (gunicorn) each open stream holds a worker thread, so event_stream_sync ends
+# after RESULTS_STREAM_WSGI_MAX_SECONDS and lets EventSource reconnect.
+
+STREAM_TICKET_SALT = 'electionapp.results-stream'
+
+
+def live_counts(election_id):
+    from .models import Election, CandidateTally
+    election = Election.objects.get(id=election_id)
+    # Turnout is summed from the same rows as the per-candidate counts so a
+    # vote landing between two queries can't make them disagree.
+    candidates = {
+        str(candidat_id): vote_count
+        for candidat_id, vote_count in CandidateTally.objects.filter(election_id=election_id).values_list('candidat_id', 'vote_count')
+    }
+    voted = sum(candidates.values())
+    total_voters = election.eligible_voters().count()
+    return {
+        'election': election_id,
+        'statut': election.statut,
+        'voters_who_voted': voted,
+        'total_voters': total_voters,
+        'turnout': round(voted / total_voters, 4) if total_voters else 0.0,
+        'candidates': candidates,
+    }
+
+
+def mint_stream_ticket(user_id, election_id):
+    # EventSource cannot send an Authorization header; rather than the access
+    # token, the stream URL carries this short-lived ticket for one election.
+    return signing.dumps({'u': user_id, 'e': election_id}, salt=STREAM_TICKET_SALT)
+
+
+def read_stream_ticket(ticket, election_id):
+    """The user id a ticket was minted for, or None."""
+    try:
+        payload = signing.loads(ticket, salt=STREAM_TICKET_SALT, max_age=getattr(settings, 'RESULTS_STREAM_TICKET_TTL', 30))
+    except signing.BadSignature:
+        return None
+    return payload['u'] if payload['e'] == election_id else None
+
+
+class Subscriber:
+    def __init__(self, loop):
+        self.loop = loop
+        # Only the latest update matters: a slow client skips intermediate ones.
+        self.queue = asyncio.Queue(maxsize=1)
+
+    def offer(self, update):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(update)
+
+    def notify(self, update):
+        self.loop.call_soon_threadsafe(self.offer, update)
+
+
+class ThreadSubscriber:
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=1)
+        self.lock = threading.Lock()
+
+    def notify(self, update):
+        with self.lock:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.queue.put_nowait(update)
+
+
+class ElectionBroadcaster:
+    def __init__(self, election_id):
+        self.election_id = election_id
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.latest = None
+        self.thread = None
+
+    def subscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.add(subscriber)
+            if self.latest is not None:
+                subscriber.notify(self.latest)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name=f'results-stream-{self.election_id}', daemon=True)
+                self.thread.start()
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, update):
+        with self.lock:
+            self.latest = update
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.notify(update)
+            except RuntimeError:
+                # The subscriber's loop is gone (client disconnected mid-send).
+                self.unsubscribe(subscriber)
+
+    def fingerprint(self):
+        from .models import Election
+        return Election.objects.filter(id=self.election_id).values_list('statut', 'resultat_id', 'tally__vote_count').first()
+
+    def run(self):
+        from .results_cache import results_version
+        interval = 1 / getattr(settings, 'RESULTS_STREAM_MAX_RATE', 2)
+        shared = getattr(settings, 'SHARED_CACHE', False)
+        version, previous = None, None
+        fingerprint, changes = None, 0
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    self.thread = None
+                    self.latest = None
+                    return
+            started = time.monotonic()
+            close_old_connections()
+            try:
+                if shared:
+                    current = results_version(self.election_id)
+                else:
+                    latest = self.fingerprint()
+                    if latest != fingerprint:
+                        fingerprint, changes = latest, changes + 1
+                    current = changes
+                if current != version:
+                    counts = live_counts(self.election_id)
+                    old = previous['candidates'] if previous else {}
+                    counts['version'] = current
+                    counts['delta'] = {
+                        candidat_id: vote_count - old.get(candidat_id, 0)
+                        for candidat_id, vote_count in counts['candidates'].items()
+                        if vote_count != old.get(candidat_id, 0)
+                    }
+                    self.publish(counts)
+                    version, previous = current, counts
+            except Exception:
+                logger.exception("Results stream for election %s failed to refresh", self.election_id)
+            finally:
+                close_old_connections()
+            time.sleep(max(interval - (time.monotonic() - started), 0))
+
+
+_broadcasters = {}
+_broadcasters_lock = threading.Lock()
+
+
+def get_broadcaster(election_id):
+    with _broadcasters_lock:
+        if election_id not in _broadcasters:
+            _broadcasters[election_id] = ElectionBroadcaster(election_id)
+        return _broadcasters[election_id]
+
+
+def _event(update):
+    return f"id: {update['version']}\nevent: results\ndata: {json.dumps(update)}\n\n"
+
+
+async def event_stream(election_id):
+    broadcaster = get_broadcaster(election_id)
+    subscriber = Subscriber(asyncio.get_running_loop())
+    broadcaster.subscribe(subscriber)
+    heartbeat = getattr(settings, 'RESULTS_STREAM_HEARTBEAT', 15)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                update = await asyncio.wait_for(subscriber.queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield _event(update)
+    finally:
+        broadcaster.unsubscribe(subscriber)
+
+
+def event_stream_sync(election_id):
+    broadcaster = get_broadcaster(election_id)
+    subscriber = ThreadSubscriber()
+    broadcaster.subscribe(subscriber)
+    heartbeat = getattr(settings, 'RESULTS_STREAM_HEARTBEAT', 15)
+    deadline = time.monotonic() + getattr(settings, 'RESULTS_STREAM_WSGI_MAX_SECONDS', 60)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                update = subscriber.queue.get(timeout=min(heartbeat, remaining))
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield _event(update)
+    finally:
+        broadcaster.unsubscribe(subscriber)
@@ -0,0 +1,125 @@
+from django.db import transaction, IntegrityError
+from django.db.models import Count, F
+from django.utils import timezone
+from .models import Vote, Election, ElectionTally, CandidateTally, Resultat
+from .results_cache import invalidate_results
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def increment_tallies(election_id, candidat_id):
+    # Must run inside the transaction that inserts the Vote so counters and
+    # votes commit (or roll back) together. Rows are only created on the
+    # first vote for an election/candidate.
+    _increment(ElectionTally, election_id=election_id)
+    _increment(CandidateTally, election_id=election_id, candidat_id=candidat_id)
+    invalidate_results(election_id)
+
+
+def _increment(model, **lookup):
+    if model.objects.filter(**lookup).update(vote_count=F('vote_count') + 1):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(vote_count=1, **lookup)
+    except IntegrityError:
+        # Lost a race with a concurrent first vote: the row exists now.
+        model.objects.filter(**lookup).update(vote_count=F('vote_count') + 1)
+
+
+def counted_votes(election_ids=None):
+    votes = Vote.objects.filter(estNul=False)
+    if election_ids is not None:
+        votes = votes.filter(election_id__in=election_ids)
+    per_candidate = {
+        (row['election_id'], row['choix_id']): row['total']
+        for row in votes.values('election_id', 'choix_id').annotate(total=Count('id'))
+    }
+    per_election = {}
+    for (election_id, _), total in per_candidate.items():
+        per_election[election_id] = per_election.get(election_id, 0) + total
+    return per_election, per_candidate
+
+
+def stored_tallies(election_ids=None):
+    election_tallies = ElectionTally.objects.all()
+    candidate_tallies = CandidateTally.objects.all()
+    if election_ids is not None:
+        election_tallies = election_tallies.filter(election_id__in=election_ids)
+        candidate_tallies = candidate_tallies.filter(election_id__in=election_ids)
+    per_election = {t.election_id: t.vote_count for t in election_tallies if t.vote_count}
+    per_candidate = {(t.election_id, t.candidat_id): t.vote_count for t in candidate_tallies if t.vote_count}
+    return per_election, per_candidate
+
+
+def verify_tallies(election_ids=None):
+    expected_elections, expected_candidates = counted_votes(election_ids)
+    actual_elections, actual_candidates = stored_tallies(election_ids)
+    mismatches = []
+    for key in sorted(set(expected_elections) | set(actual_elections)):
+        if expected_elections.get(key, 0) != actual_elections.get(key, 0):
+            mismatches.append(('election', key, expected_elections.get(key, 0), actual_elections.get(key, 0)))
+    for key in sorted(set(expected_candidates) | set(actual_candidates)):
+        if expected_candidates.get(key, 0) != actual_candidates.get(key, 0):
+            mismatches.append(('candidat', key, expected_candidates.get(key, 0), actual_candidates.get(key, 0)))
+    return mismatches
+
+
+@transaction.atomic
+def rebuild_tallies(election_ids=None):
+    per_election, per_candidate = counted_votes(election_ids)
+    election_tallies = ElectionTally.objects.all()
+    candidate_tallies = CandidateTally.objects.all()
+    if election_ids is not None:
+        election_tallies = election_tallies.filter(election_id__in=election_ids)
+        candidate_tallies = candidate_tallies.filter(election_id__in=election_ids)
+    election_tallies.delete()
+    candidate_tallies.delete()
+    ElectionTally.objects.bulk_create([
+        ElectionTally(election_id=election_id, vote_count=total) for election_id, total in per_election.items()
+    ])
+    CandidateTally.objects.bulk_create([
+        CandidateTally(election_id=election_id, candidat_id=candidat_id, vote_count=total)
+        for (election_id, candidat_id), total in per_candidate.items()
+    ])
+    for election_id in (election_ids if election_ids is not None else Election.objects.values_list('id', flat=True)):
+        invalidate_results(election_id)
+    logger.info("Rebuilt tallies for %s elections, %s candidates", len(per_election), len(per_candidate))
+    return per_election, per_candidate
+
+
+@transaction.atomic
+def publish_results(election):
+    # Freezes the final counts into a Resultat with one GROUP BY over the
+    # eligible voters' ballots. Publishing again returns the existing snapshot.
+    if election.resultat_id:
+        return election.resultat
+    counts = dict(
+        Vote.objects.filter(election=election, electeur__in=election.eligible_voters(), estNul=False)
+        .values_list('choix_id').annotate(total=Count('id')).order_by()
+    )
+    candidats = election.listeCandidats.candidats.order_by('id') if election.listeCandidats_id else []
+    candidate_counts = [
+        {'candidat_id': candidat.id, 'nom': candidat.nom, 'vote_count': counts.get(candidat.id, 0)}
+        for candidat in candidats
+    ]
+    results = {}
+    for entry in candidate_counts:
+        if entry['vote_count']:
+            results[entry['nom']] = results.get(entry['nom'], 0) + entry['vote_count']
+    result = Resultat(
+        election=election,
+        candidate_counts=candidate_counts,
+        results=results,
+        total_voters=election.eligible_voters().count(),
+        voters_who_voted=sum(counts.values()),
+        published_at=timezone.now(),
+    )
+    result.checksum = result.compute_checksum()
+    result.save()
+    election.resultat = result
+    election.statut = 'ferme'
+    election.save(update_fields=['resultat', 'statut'])
+    logger.info("Results snapshot %s stored for election %s", result.checksum[:12], election.id)
+    return result
@@ -1,12 +1,104 @@
 from celery import shared_task
+from django.conf import settings
 from django.utils import timezone
-from electionapp.models import Election
+from django.db import transaction
+from electionapp.models import ImportJob, BiometricSession
+from electionapp.serial_reader import SensorOwnedElsewhere, get_sensor_pool
+import serial
+from electionapp.importers import import_users, missing_columns
+from electionapp.scheduler import apply_transitions
+from electionapp.user_context import invalidate_utilisateur
+import pandas as pd
 import logging
 
 logger = logging.getLogger(__name__)
 
+@shared_task
+def apply_election_transitions():
+    # Queued with an ETA at each election's startdate/enddate by schedule_election.
+    apply_transitions()
+
 @shared_task
 def close_expired_elections():
-    now = timezone.now()
-    closed_count = Election.objects.filter(enddate__lt=now, statut="ouvert").update(statut="ferme")
-    logger.info(f"[DEBUG] {now}: Closed {closed_count} elections")
\ No newline at end of file
+    # Beat safety net for transitions whose ETA task was lost.
+    opened, closed = apply_transitions()
+    logger.debug("%s: Opened %s, closed %s elections", timezone.now(), opened, len(closed))
+
+@shared_task
+def run_user_import(job_id):
+    job = ImportJob.objects.get(id=job_id)
+    job.statut = 'en_cours'
+    job.started_at = timezone.now()
+    job.save(update_fields=['statut', 'started_at'])
+
+    def progress(rows_processed, report):
+        ImportJob.objects.filter(id=job_id).update(
+            rows_processed=rows_processed,
+            created_count=report['created'],
+            updated_count=report['updated'],
+        )
+
+    try:
+        with job.file.open('rb') as f:
+            df = pd.read_excel(f)
+        missing = missing_columns(df)
+        if missing:
+            raise ValueError(f"Missing required columns: {missing}")
+        ImportJob.objects.filter(id=job_id).update(rows_total=len(df))
+        report = import_users(df, chunk_size=getattr(settings, 'USER_IMPORT_CHUNK_SIZE', 1000), progress=progress)
+        ImportJob.objects.filter(id=job_id).update(
+            statut='termine', rows_processed=len(df), created_count=report['created'],
+            updated_count=report['updated'], errors=report['errors'], finished_at=timezone.now(),
+        )
+        logger.info("Import job %s finished: %s created, %s updated", job_id, report['created'], report['updated'])
+    except Exception as e:
+        logger.error("Import job %s failed: %s", job_id, e)
+        ImportJob.objects.filter(id=job_id).update(statut='echec', error=str(e), finished_at=timezone.now())
+    finally:
+        # The spreadsheet holds student records; only the job's report is kept.
+        job.file.delete(save=False)
+        ImportJob.objects.filter(id=job_id).update(file='')
+
+@shared_task
+def run_biometric_session(session_id):
+    session = BiometricSession.objects.select_related('utilisateur__user').get(id=session_id)
+    utilisateur = session.utilisateur
+    BiometricSession.objects.filter(id=session_id).update(statut='en_cours')
+    statut, error, fingerprint_id, sensor = 'echec', '', None, None
+    pool = get_sensor_pool()
+    try:
+        if session.mode == 'enroll':
+            fingerprint_id, sensor = pool.scan(mode='enroll', user_id=utilisateur.id, booth=session.booth or None)
+            if fingerprint_id:
+                with transaction.atomic():
+                    utilisateur.fingerprint_id = fingerprint_id
+                    utilisateur.user.password = session.password
+                    utilisateur.is_first_login = False
+                    utilisateur.user.save()
+                    utilisateur.save()
+                invalidate_utilisateur(utilisateur)
+                statut = 'reussi'
+                logger.info("First login completed for %s, fingerprint_id=%s", utilisateur.user.username, fingerprint_id)
+            else:
+                error = "Failed to enroll fingerprint"
+        else:
+            fingerprint_id, sensor = pool.scan(mode='verify', booth=session.booth or None)
+            if fingerprint_id and fingerprint_id == utilisateur.fingerprint_id:
+                statut = 'reussi'
+                logger.info("Fingerprint verified for user %s, fingerprint_id=%s", utilisateur.user.username, fingerprint_id)
+            else:
+                error = "Fingerprint verification failed"
+                logger.error("Fingerprint verification failed for %s, received_id=%s, expected_id=%s", utilisateur.user.username, fingerprint_id, utilisateur.fingerprint_id)
+    except SensorOwnedElsewhere as e:
+        logger.error("%s", e)
+        error = str(e)
+    except serial.serialutil.SerialException as e:
+        logger.error("Serial error: %s", e)
+        error = "Failed to communicate with fingerprint sensor"
+    except Exception as e:
+        logger.error("Fingerprint error: %s", e)
+        error = str(e)
+    BiometricSession.objects.filter(id=session_id).update(
+        statut=statut, error=error, fingerprint_id=fingerprint_id, password='', finished_at=timezone.now(),
+        sensor=sensor.port if sensor else '',
+    )
@@ -1,3 +1,855 @@
-from django.test import TestCase
+from datetime import timedelta
+import os
+import io
+import json
+import logging
+import random
+import tempfile
+import csv
+import unittest
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from openpyxl import load_workbook
+import pandas as pd
+import serial
+from electionsystem.log_config import JsonFormatter, QueueStreamHandler
+from .authentication import CachedRefreshToken, is_revoked, tokens_for, _warm_revoked
+from .background import _queue_for
+from .eligibility import criteria_to_q, elections_for
+from .eligibility_engine import EligibilityEngine
+from .grants import mint_grant
+from .importers import import_users
+from .login_pipeline import _buckets, get_login_pool
+from .models import Activite, BiometricSession, CandidateTally, Election, ElectionTally, ElectionEligibility, ImportJob, ListeCandidats, Utilisateur, Vote
+from .query_inspector import assert_query_budget
+from .results_cache import results_etag, results_version
+from .scheduler import TransitionScheduler, apply_transitions, expected_statut, next_transition
+from .serial_reader import FingerprintReader, FingerprintSensor, SensorEvent, SensorOwnedElsewhere, SensorPool, UnknownBooth, parse_frame
+from .tasks import run_biometric_session, run_user_import
+from .tallies import publish_results, rebuild_tallies, verify_tallies
+from .user_context import invalidate_utilisateur
 
-# Create your tests here.
+
+def create_student(i, password=None, **fields):
+    user = User.objects.create_user(f'etu{i}', password=password)
+    return Utilisateur.objects.create(user=user, matricule=str(1000 + i), nom=f'Etu {i}', **fields)
+
+
+def create_election(liste, criteria=None, opened=True, **fields):
+    now = timezone.now()
+    fields = {
+        'startdate': now - timedelta(hours=2),
+        'enddate': now + timedelta(hours=1) if opened else now - timedelta(hours=1),
+        **fields,
+    }
+    return Election.objects.create(nom='Election', listeCandidats=liste, allowed_voter_criteria=criteria or {}, **fields)
+
+
+def bearer(user, utilisateur=None, **headers):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens_for(user, utilisateur).access_token}', **headers)
+    return client
+
+
+class ElectionTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='admin', is_staff=True)
+        cls.activites = {nom: Activite.objects.create(nom=nom) for nom, _ in Activite.ACTIVITE_CHOICES}
+        cls.candidats = [create_student(i, classe=1, mention='INFO') for i in range(2)]
+        cls.liste = ListeCandidats.objects.create(nom='Liste')
+        cls.liste.candidats.set(cls.candidats)
+
+    def setUp(self):
+        cache.clear()
+
+
+class ResultsStreamTests(ElectionTestCase):
+    def ticket(self, user, election, utilisateur=None):
+        return bearer(user, utilisateur).post(f'/api/elections/{election.id}/resultats/stream/ticket/')
+
+    def test_student_subscriber_is_checked_against_eligibility(self):
+        election = create_election(self.liste, {'mention': ['INFO']}, opened=False)
+        other = create_election(self.liste, opened=False)
+        publish_results(election)
+        url = f'/api/elections/{election.id}/resultats/stream/'
+        eligible = create_student(10, classe=2, mention='INFO')
+        outsider = create_student(11, classe=2, mention='ECO')
+
+        response = self.ticket(eligible.user, election, eligible)
+        self.assertEqual(response.status_code, 200)
+        ticket = response.json()['ticket']
+        response = self.client.get(url, {'ticket': ticket})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        response.close()
+
+        self.assertEqual(self.ticket(outsider.user, election, outsider).status_code, 403)
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.assertEqual(self.client.get(f'/api/elections/{other.id}/resultats/stream/', {'ticket': ticket}).status_code, 401)
+        # The access token itself is no longer accepted in the URL.
+        token = tokens_for(eligible.user, eligible).access_token
+        self.assertEqual(self.client.get(url, {'token': str(token)}).status_code, 401)
+
+    @override_settings(RESULTS_STREAM_WSGI_MAX_SECONDS=0.3, RESULTS_STREAM_HEARTBEAT=0.1)
+    def test_wsgi_stream_ends_so_the_worker_is_released(self):
+        election = create_election(self.liste, opened=False)
+        publish_results(election)
+        ticket = self.ticket(self.admin, election).json()['ticket']
+        with mock.patch('electionapp.streams.ElectionBroadcaster.subscribe'):
+            response = self.client.get(f'/api/elections/{election.id}/resultats/stream/', {'ticket': ticket})
+            chunks = [chunk.decode() for chunk in response.streaming_content]
+        self.assertEqual(chunks[0], 'retry: 3000\n\n')
+        self.assertIn(': keepalive\n\n', chunks)
+
+
+class TokenClaimsTests(ElectionTestCase):
+    def test_claims_are_ignored_without_a_shared_cache(self):
+        election = create_election(self.liste, {'mention': ['INFO']})
+        student = create_student(10, classe=1, mention='INFO')
+        client = bearer(student.user, student)
+        # Changed by another worker, whose invalidation this process never sees.
+        Utilisateur.objects.filter(pk=student.pk).update(mention='ECO')
+        response = client.post(f'/api/elections/{election.id}/vote/', {'candidate': self.candidats[0].id}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(SHARED_CACHE=True)
+    def test_shared_cache_invalidation_retires_claims(self):
+        election = create_election(self.liste, {'mention': ['INFO']})
+        student = create_student(10, classe=1, mention='INFO')
+        client = bearer(student.user, student)
+        student.mention = 'ECO'
+        student.save()
+        invalidate_utilisateur(student)
+        response = client.post(f'/api/elections/{election.id}/vote/', {'candidate': self.candidats[0].id}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(SHARED_CACHE=True)
+    def test_first_login_rereads_the_database(self):
+        student = create_student(10, is_first_login=True)
+        client = bearer(student.user, student)
+        Utilisateur.objects.filter(pk=student.pk).update(is_first_login=False, fingerprint_id='7')
+        response = client.post('/api/first-login/', {'new_password': 'nouveau-mot-de-passe'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def assert_reads_own_records(self):
+        student = create_student(10, classe=1, mention='INFO')
+        session = BiometricSession.objects.create(mode='verify', utilisateur=student)
+        other = BiometricSession.objects.create(mode='verify', utilisateur=self.candidats[0])
+        client = bearer(student.user, student)
+        self.assertEqual(client.get(f'/api/users/{student.pk}/').status_code, 200)
+        self.assertEqual(client.get(f'/api/users/by-user-id/{student.user_id}/').status_code, 200)
+        self.assertEqual(client.get(f'/api/fingerprint/sessions/{session.id}/').status_code, 200)
+        self.assertEqual(client.get(f'/api/users/{self.candidats[0].pk}/').status_code, 403)
+        self.assertEqual(client.get(f'/api/fingerprint/sessions/{other.id}/').status_code, 403)
+
+    def test_student_reads_own_records(self):
+        self.assert_reads_own_records()
+
+    @override_settings(SHARED_CACHE=True)
+    def test_student_reads_own_records_from_claims(self):
+        self.assert_reads_own_records()
+
+    def test_demoted_staff_loses_access(self):
+        for shared in (False, True):
+            with self.subTest(shared=shared), override_settings(SHARED_CACHE=shared):
+                staff = User.objects.create_user(f'staff{shared}', is_staff=True)
+                client = bearer(staff)
+                self.assertEqual(client.get('/api/login/metrics/').status_code, 200)
+                staff.is_staff = False
+                staff.save()
+                self.assertEqual(client.get('/api/login/metrics/').status_code, 403)
+                staff.is_active = False
+                staff.save()
+                self.assertEqual(client.get('/api/login/metrics/').status_code, 401)
+
+
+class TokenRefreshTests(ElectionTestCase):
+    def refresh(self, token):
+        return APIClient().post('/api/token/refresh/', {'refresh': token}, format='json')
+
+    def test_rotated_refresh_token_is_revoked(self):
+        refresh = str(tokens_for(self.admin))
+        response = self.refresh(refresh)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(is_revoked(CachedRefreshToken(response.json()['refresh'], verify=False)))
+        self.assertTrue(is_revoked(CachedRefreshToken(refresh, verify=False)))
+        self.assertEqual(self.refresh(refresh).status_code, 401)
+
+    @override_settings(SHARED_CACHE=True)
+    def test_shared_cache_check_skips_the_blacklist_tables(self):
+        refresh = str(tokens_for(self.admin))
+        CachedRefreshToken(refresh)
+        with self.assertNumQueries(0):
+            CachedRefreshToken(refresh)
+
+
+class LoginPipelineTests(ElectionTestCase):
+    def test_full_pool_refuses_api_logins_only(self):
+        with mock.patch.object(get_login_pool(), 'max_pending', 0):
+            response = APIClient().post('/api/token/', {'username': 'admin', 'password': 'admin'}, format='json')
+            self.assertEqual(response.status_code, 503)
+            self.assertIn('Retry-After', response)
+            # The admin form has no way to show a 503; it hashes inline.
+            response = self.client.post('/admin/login/', {'username': 'admin', 'password': 'admin', 'next': '/admin/'})
+            self.assertRedirects(response, '/admin/', fetch_redirect_response=False)
+
+
+class LoginThrottleTests(ElectionTestCase):
+    def setUp(self):
+        super().setUp()
+        _buckets.clear()
+        self.addCleanup(_buckets.clear)
+
+    def login(self, ip, password='wrong', **headers):
+        return APIClient().post('/api/token/', {'username': 'admin', 'password': password}, format='json', REMOTE_ADDR=ip, **headers)
+
+    def test_guessing_from_one_ip_does_not_lock_out_another(self):
+        for _ in range(5):
+            self.assertEqual(self.login('10.0.0.66').status_code, 401)
+        self.assertEqual(self.login('10.0.0.66').status_code, 429)
+        self.assertEqual(self.login('10.0.0.7', password='admin').status_code, 200)
+
+    def test_forwarded_for_is_ignored_without_trusted_proxies(self):
+        for i in range(5):
+            self.login('10.0.0.66', HTTP_X_FORWARDED_FOR=f'192.0.2.{i}')
+        self.assertEqual(self.login('10.0.0.66', HTTP_X_FORWARDED_FOR='192.0.2.99').status_code, 429)
+        with override_settings(LOGIN_NUM_PROXIES=1):
+            self.assertEqual(self.login('10.0.0.1', HTTP_X_FORWARDED_FOR='192.0.2.99, 10.0.0.66').status_code, 429)
+            self.assertEqual(self.login('10.0.0.1', HTTP_X_FORWARDED_FOR='10.0.0.66, 192.0.2.99').status_code, 401)
+
+    @override_settings(LOGIN_THROTTLE_MAX_KEYS=4)
+    def test_new_keys_evict_the_least_recently_used_buckets(self):
+        for _ in range(5):
+            self.login('10.0.0.66')
+        self.login('10.0.0.1')
+        self.assertEqual(self.login('10.0.0.66').status_code, 429)
+        # 10.0.0.2 pushes out 10.0.0.1's buckets, not the attacker's.
+        self.login('10.0.0.2')
+        self.assertEqual(len(_buckets), 4)
+        self.assertNotIn(('ip', '10.0.0.1'), _buckets)
+        self.assertEqual(self.login('10.0.0.66').status_code, 429)
+
+
+@override_settings(BIOMETRIC_VOTE_REQUIRED=True)
+class BiometricGrantTests(ElectionTestCase):
+    def test_failed_vote_gives_the_grant_back(self):
+        election = create_election(self.liste)
+        student = create_student(10)
+        session = BiometricSession.objects.create(
+            mode='verify', utilisateur=student, statut='reussi', finished_at=timezone.now(),
+        )
+        client = bearer(student.user, student, HTTP_X_BIOMETRIC_GRANT=mint_grant(session))
+        url = f'/api/elections/{election.id}/vote/'
+
+        self.assertEqual(client.post(url, {'candidate': student.id}, format='json').status_code, 400)
+        self.assertEqual(client.post(url, {'candidate': self.candidats[0].id}, format='json').status_code, 201)
+        self.assertEqual(Vote.objects.filter(electeur=student).count(), 1)
+        response = client.post(url, {'candidate': self.candidats[0].id}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_grant_is_spent_for_every_worker(self):
+        first, second = create_election(self.liste), create_election(self.liste)
+        student = create_student(10)
+        session = BiometricSession.objects.create(
+            mode='verify', utilisateur=student, statut='reussi', finished_at=timezone.now(),
+        )
+        client = bearer(student.user, student, HTTP_X_BIOMETRIC_GRANT=mint_grant(session))
+        self.assertEqual(client.post(f'/api/elections/{first.id}/vote/', {'candidate': self.candidats[0].id}, format='json').status_code, 201)
+        # Another worker's cache has never seen the grant.
+        cache.clear()
+        response = client.post(f'/api/elections/{second.id}/vote/', {'candidate': self.candidats[0].id}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class BiometricSessionTests(ElectionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pool = mock.Mock(spec=SensorPool)
+        self.pool.booths.return_value = {'b1'}
+        self.pool.scan.return_value = ('7', mock.Mock(port='COM7'))
+        for target in ('electionapp.api_views.get_sensor_pool', 'electionapp.tasks.get_sensor_pool'):
+            patcher = mock.patch(target, return_value=self.pool)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Run the session inline instead of on the biometric queue.
+        patcher = mock.patch('electionapp.api_views.submit', side_effect=lambda task, *args: task(*args))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def session(self, client, session_id):
+        response = client.get(f'/api/fingerprint/sessions/{session_id}/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_enroll_sets_fingerprint_and_password_once(self):
+        student = create_student(10, password='1010')
+        client = bearer(student.user, student)
+        response = client.post('/api/first-login/', {'new_password': 'nouveau', 'booth': 'b1'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.pool.scan.assert_called_once_with(mode='enroll', user_id=student.id, booth='b1')
+        data = self.session(client, response.json()['session_id'])
+        self.assertEqual((data['statut'], data['fingerprint_id'], data['sensor']), ('reussi', '7', 'COM7'))
+        self.assertNotIn('grant', data)
+        student.refresh_from_db()
+        student.user.refresh_from_db()
+        self.assertEqual((student.fingerprint_id, student.is_first_login), ('7', False))
+        self.assertTrue(student.user.check_password('nouveau'))
+        self.assertEqual(BiometricSession.objects.get().password, '')
+        response = client.post('/api/first-login/', {'new_password': 'encore'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_verified_session_grants_one_vote_to_its_owner(self):
+        election = create_election(self.liste)
+        student = create_student(10, fingerprint_id='7', is_first_login=False)
+        client = bearer(student.user, student)
+        session_id = client.post('/api/fingerprint/verify/', format='json').json()['session_id']
+        self.pool.scan.assert_called_once_with(mode='verify', booth=None)
+        data = self.session(client, session_id)
+        self.assertEqual(data['statut'], 'reussi')
+        self.assertNotIn('grant', self.session(bearer(self.admin), session_id))
+        other = create_student(11)
+        self.assertEqual(bearer(other.user, other).get(f'/api/fingerprint/sessions/{session_id}/').status_code, 403)
+        with override_settings(BIOMETRIC_VOTE_REQUIRED=True):
+            url = f'/api/elections/{election.id}/vote/'
+            self.assertEqual(client.post(url, {'candidate': self.candidats[0].id}, format='json').status_code, 403)
+            client = bearer(student.user, student, HTTP_X_BIOMETRIC_GRANT=data['grant'])
+            self.assertEqual(client.post(url, {'candidate': self.candidats[0].id}, format='json').status_code, 201)
+
+    def test_failed_scans_end_the_session_without_a_grant(self):
+        student = create_student(10, fingerprint_id='8', is_first_login=False)
+        client = bearer(student.user, student)
+        session_id = client.post('/api/fingerprint/verify/', format='json').json()['session_id']
+        data = self.session(client, session_id)
+        self.assertEqual((data['statut'], data['error']), ('echec', "Fingerprint verification failed"))
+        self.assertNotIn('grant', data)
+        self.pool.scan.side_effect = serial.SerialException("port fermé")
+        session_id = client.post('/api/fingerprint/verify/', format='json').json()['session_id']
+        data = self.session(client, session_id)
+        self.assertEqual((data['statut'], data['error'], data['sensor']), ('echec', "Failed to communicate with fingerprint sensor", ''))
+        self.assertIsNotNone(data['finished_at'])
+
+
+class BoothTests(ElectionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pool = SensorPool([FingerprintSensor('loop://', booth='b1'), FingerprintSensor('loop://', booth='b2')])
+
+    def test_scan_never_falls_back_to_another_booth(self):
+        with self.pool.acquire('b2', timeout=0) as sensor:
+            self.assertEqual(sensor.booth, 'b2')
+            with self.assertRaises(serial.SerialException):
+                with self.pool.acquire('b2', timeout=0):
+                    pass
+        with self.assertRaises(UnknownBooth):
+            with self.pool.acquire('b3', timeout=0):
+                pass
+
+    def test_unknown_booth_is_refused_before_the_session_starts(self):
+        student = create_student(10)
+        with mock.patch('electionapp.api_views.get_sensor_pool', return_value=self.pool):
+            response = bearer(student.user, student).post('/api/fingerprint/verify/', {'booth': 'b3'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(BiometricSession.objects.exists())
+
+
+class ImportJobTests(ElectionTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def run_import(self, rows):
+        buffer = io.BytesIO()
+        pd.DataFrame(rows).to_excel(buffer, index=False)
+        job = ImportJob.objects.create(file=SimpleUploadedFile('etudiants.xlsx', buffer.getvalue()))
+        path = job.file.path
+        run_user_import(job.id)
+        job.refresh_from_db()
+        self.assertFalse(job.file)
+        self.assertFalse(os.path.exists(path))
+        return job
+
+    def test_upload_is_deleted_after_import(self):
+        job = self.run_import([{
+            'matricule': '2001', 'nom': 'Rakoto', 'username': 'rakoto', 'annee_universitaire': '2024-2025',
+            'classe': 1, 'mention': 'INFO', 'activites': '',
+        }])
+        self.assertEqual((job.statut, job.created_count), ('termine', 1))
+
+    def test_upload_is_deleted_after_a_failed_import(self):
+        job = self.run_import([{'matricule': '2001'}])
+        self.assertEqual(job.statut, 'echec')
+
+
+class ImportValidationTests(ElectionTestCase):
+    def row(self, matricule, username, **fields):
+        return {
+            'matricule': matricule, 'nom': f'Nom {matricule}', 'username': username,
+            'annee_universitaire': '2024-2025', 'classe': 1, 'mention': 'INFO', 'activites': '', **fields,
+        }
+
+    def test_each_rule_rejects_its_rows(self):
+        df = pd.DataFrame([
+            self.row('2001', 'ok'),
+            self.row('201', 'court'),
+            self.row('20a2', 'lettre'),
+            self.row('2003', 'classe', classe=6),
+            self.row('2004', 'demi', classe=1.5),
+            self.row('2005', 'mention', mention='MATH'),
+            self.row('2006', 'sport', sport_type='RUGBY'),
+            self.row('2007', None),
+            self.row('2008', 'premier'),
+            self.row('2008', 'dernier'),
+        ])
+        report = import_users(df)
+        self.assertEqual(report['errors'], [
+            {'row': 3, 'matricule': '201', 'error': "Matricule invalide"},
+            {'row': 4, 'matricule': '20a2', 'error': "Matricule invalide"},
+            {'row': 5, 'matricule': '2003', 'error': "Classe invalide"},
+            {'row': 6, 'matricule': '2004', 'error': "Classe invalide"},
+            {'row': 7, 'matricule': '2005', 'error': "Mention invalide"},
+            {'row': 8, 'matricule': '2006', 'error': "Type de sport invalide"},
+            {'row': 9, 'matricule': '2007', 'error': "Username manquant"},
+            {'row': 10, 'matricule': '2008', 'error': "Matricule dupliqué dans le fichier"},
+        ])
+        self.assertEqual((report['created'], report['updated']), (2, 0))
+        self.assertEqual(Utilisateur.objects.get(matricule='2008').user.username, 'dernier')
+
+    def test_usernames_clash_with_other_accounts(self):
+        etu = self.candidats[0]
+        report = import_users(pd.DataFrame([
+            self.row(etu.matricule, 'renomme', classe=3, mention='ECO'),
+            self.row(self.candidats[1].matricule, 'admin'),
+            self.row('2001', 'etu1'),
+            self.row('2002', 'neuf'),
+        ]))
+        self.assertEqual(report['errors'], [
+            {'row': 3, 'matricule': self.candidats[1].matricule, 'error': "Username admin déjà utilisé"},
+            {'row': 4, 'matricule': '2001', 'error': "Username etu1 existe déjà"},
+        ])
+        self.assertEqual((report['created'], report['updated']), (1, 1))
+        etu.refresh_from_db()
+        self.assertEqual((etu.user.username, etu.classe, etu.mention, etu.is_first_login), ('renomme', 3, 'ECO', True))
+        self.assertEqual(User.objects.get(username='neuf').utilisateur_set.get().matricule, '2002')
+
+    def test_activites_and_sport_type_are_normalised(self):
+        import_users(pd.DataFrame([
+            self.row('2001', 'a', activites=' sport, Danse,SPORT,poterie', sport_type=' FOOT '),
+            self.row('2002', 'b', activites=None),
+        ]))
+        first = Utilisateur.objects.get(matricule='2001')
+        self.assertEqual(sorted(first.activites.values_list('nom', flat=True)), ['DANSE', 'SPORT'])
+        self.assertEqual(first.sport_type, 'FOOT')
+        second = Utilisateur.objects.get(matricule='2002')
+        self.assertFalse(second.activites.exists())
+        self.assertIsNone(second.sport_type)
+
+    def test_chunks_report_progress_and_keep_a_reimport_idempotent(self):
+        df = pd.DataFrame([self.row(str(2001 + i), f'u{i}') for i in range(5)] + [self.row('99', 'x')])
+        calls = []
+        report = import_users(df, chunk_size=2, progress=lambda rows, report: calls.append((rows, report['created'])))
+        self.assertEqual(calls, [(3, 2), (5, 4), (6, 5)])
+        self.assertEqual(len(report['errors']), 1)
+        report = import_users(df, chunk_size=2)
+        self.assertEqual((report['created'], report['updated']), (0, 5))
+
+
+class ExportTests(ElectionTestCase):
+    def download(self, url, user=None):
+        response = bearer(user or self.admin).get(url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def csv_rows(self, url):
+        content = self.download(url).decode('utf-8')
+        self.assertTrue(content.startswith('\ufeff'))
+        return list(csv.reader(io.StringIO(content[1:])))
+
+    def test_user_exports_match_in_both_formats(self):
+        self.candidats[0].activites.set([self.activites['SPORT'], self.activites['DANSE']])
+        Utilisateur.objects.filter(id=self.candidats[0].id).update(sport_type='FOOT', classe=4)
+        rows = self.csv_rows('/api/users/export-csv/')
+        self.assertEqual(rows, [
+            ['Nom', 'Prénom', 'Classe', 'Mention', 'Activités', 'Type de sport', 'Année universitaire'],
+            ['Etu 0', 'etu0', 'M1', 'Informatique', 'DANSE, SPORT', 'FOOT', '2024-2025'],
+            ['Etu 1', 'etu1', 'L1', 'Informatique', 'N/A', 'N/A', '2024-2025'],
+        ])
+        sheet = load_workbook(io.BytesIO(self.download('/api/users/export-excel/')), read_only=True)['Users']
+        self.assertEqual([list(row) for row in sheet.iter_rows(values_only=True)], rows)
+
+    def test_election_exports_count_voters_and_eligible_students(self):
+        election = create_election(self.liste, {'mention': ['INFO']})
+        create_student(10, mention='ECO')
+        self.candidats[1].voter(self.candidats[0].id, election)
+        rows = self.csv_rows('/api/elections/export-csv/')
+        self.assertEqual(rows[0], ['Nom', 'Date de début', 'Date de fin', 'Statut', 'Votants', 'Électeurs totaux'])
+        self.assertEqual(rows[1], [
+            'Election', election.startdate.strftime('%d/%m/%Y %H:%M'), election.enddate.strftime('%d/%m/%Y %H:%M'),
+            election.statut, '1', '2',
+        ])
+        sheet = load_workbook(io.BytesIO(self.download('/api/elections/export-excel/')), read_only=True)['Elections']
+        self.assertEqual(list(sheet.iter_rows(min_row=2, values_only=True))[0][4:], (1, 2))
+
+    def test_user_export_queries_do_not_grow_with_users(self):
+        client = bearer(self.admin)
+        self.candidats[0].activites.set([self.activites['SPORT']])
+        client.get('/api/users/export-csv/')
+        with CaptureQueriesContext(connection) as few:
+            b''.join(client.get('/api/users/export-csv/').streaming_content)
+        for i in range(10, 15):
+            create_student(i).activites.set([self.activites['CHANT']])
+        with CaptureQueriesContext(connection) as many:
+            content = b''.join(client.get('/api/users/export-csv/').streaming_content)
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(content.count(b'\n'), 8)
+
+    def test_students_cannot_export(self):
+        student = create_student(10)
+        for url in ('/api/users/export-csv/', '/api/users/export-excel/', '/api/elections/export-csv/'):
+            self.assertEqual(bearer(student.user, student).get(url).status_code, 403)
+
+
+class TallyTests(ElectionTestCase):
+    def counts(self, election):
+        return (
+            ElectionTally.objects.filter(election=election).values_list('vote_count', flat=True).first(),
+            dict(CandidateTally.objects.filter(election=election).values_list('candidat_id', 'vote_count')),
+        )
+
+    def test_votes_maintain_the_counters(self):
+        election = create_election(self.liste)
+        voters = [create_student(10 + i) for i in range(3)]
+        voters[0].voter(self.candidats[0].id, election)
+        voters[1].voter(self.candidats[0].id, election)
+        voters[2].voter(self.candidats[1].id, election)
+        with self.assertRaises(ValueError):
+            voters[0].voter(self.candidats[1].id, election)
+        with self.assertRaises(ValueError):
+            create_student(20).voter(voters[1].id, election)
+        self.assertEqual(self.counts(election), (3, {self.candidats[0].id: 2, self.candidats[1].id: 1}))
+        self.assertEqual(self.candidats[0].get_vote_count(election), 2)
+        self.assertEqual(verify_tallies(), [])
+
+    def test_rebuild_repairs_drifted_counters(self):
+        election = create_election(self.liste)
+        other = create_election(self.liste)
+        for i, target in enumerate((election, election, other)):
+            create_student(10 + i).voter(self.candidats[0].id, target)
+        ElectionTally.objects.filter(election=election).update(vote_count=7)
+        CandidateTally.objects.filter(election=other).delete()
+        self.assertEqual(verify_tallies(), [
+            ('election', election.id, 2, 7),
+            ('candidat', (other.id, self.candidats[0].id), 1, 0),
+        ])
+        rebuild_tallies([election.id])
+        self.assertEqual(self.counts(election), (2, {self.candidats[0].id: 2}))
+        self.assertEqual(verify_tallies([election.id]), [])
+        self.assertEqual(len(verify_tallies()), 1)
+        rebuild_tallies()
+        self.assertEqual(verify_tallies(), [])
+
+    def test_rebuild_tallies_command(self):
+        election = create_election(self.liste)
+        create_student(10).voter(self.candidats[0].id, election)
+        ElectionTally.objects.filter(election=election).update(vote_count=5)
+        out, err = io.StringIO(), io.StringIO()
+        with self.assertRaisesMessage(CommandError, "1 tally mismatches"):
+            call_command('rebuild_tallies', '--check', stdout=out, stderr=err)
+        self.assertIn(f"election {election.id}: expected 1, stored 5", err.getvalue())
+        call_command('rebuild_tallies', '--election', str(election.id), stdout=out, stderr=err)
+        self.assertIn("Rebuilt 1 election and 1 candidate tallies", out.getvalue())
+        self.assertEqual(self.counts(election), (1, {self.candidats[0].id: 1}))
+
+
+class SchedulerTests(ElectionTestCase):
+    def test_transitions_only_move_forward(self):
+        now = timezone.now()
+        starting = create_election(self.liste)
+        Election.objects.filter(id=starting.id).update(statut='a_venir')
+        ending = create_election(self.liste)
+        create_student(10).voter(self.candidats[0].id, ending)
+        ElectionTally.objects.filter(election=ending).update(vote_count=9)
+        Election.objects.filter(id=ending.id).update(enddate=now - timedelta(minutes=1))
+        upcoming = create_election(self.liste, startdate=now + timedelta(hours=1), enddate=now + timedelta(hours=2))
+        published = create_election(self.liste)
+        Election.objects.filter(id=published.id).update(statut='ferme')
+
+        self.assertEqual(apply_transitions(now), (1, [ending.id]))
+        statuts = dict(Election.objects.values_list('id', 'statut'))
+        self.assertEqual(
+            [statuts[e.id] for e in (starting, ending, upcoming, published)],
+            ['ouvert', 'ferme', 'a_venir', 'ferme'],
+        )
+        # Closing recounts the tallies from the ballots.
+        self.assertEqual(ElectionTally.objects.get(election=ending).vote_count, 1)
+        self.assertEqual(apply_transitions(now), (0, []))
+        published.refresh_from_db()
+        self.assertEqual(expected_statut(published, now), 'ferme')
+        self.assertEqual(expected_statut(upcoming, now), 'a_venir')
+
+    def test_next_transition_is_the_earliest_pending_date(self):
+        now = timezone.now()
+        self.assertIsNone(next_transition(now))
+        later = create_election(self.liste, startdate=now + timedelta(hours=3), enddate=now + timedelta(hours=4))
+        self.assertEqual(next_transition(now), later.startdate)
+        soon = create_election(self.liste)
+        self.assertEqual(next_transition(now), soon.enddate)
+
+    @override_settings(ELECTION_SCHEDULER_MAX_SLEEP=30)
+    def test_scheduler_sleeps_until_the_next_transition(self):
+        scheduler = TransitionScheduler()
+        delays = []
+
+        def wait(delay):
+            delays.append(delay)
+            if len(delays) == 1:
+                create_election(self.liste, enddate=timezone.now() + timedelta(seconds=5))
+            else:
+                scheduler.stop()
+
+        with mock.patch.object(scheduler.wakeup, 'wait', side_effect=wait), \
+                mock.patch('electionapp.scheduler.close_old_connections'):
+            scheduler.run()
+        self.assertEqual(delays[0], 30)
+        self.assertAlmostEqual(delays[1], 5, delta=1)
+
+    @override_settings(ELECTION_SCHEDULER_MAX_SLEEP=60)
+    def test_scheduler_survives_a_failed_iteration(self):
+        scheduler = TransitionScheduler()
+        with mock.patch('electionapp.scheduler.apply_transitions', side_effect=RuntimeError("db down")), \
+                mock.patch('electionapp.scheduler.close_old_connections'), \
+                mock.patch.object(scheduler.wakeup, 'wait', side_effect=lambda delay: scheduler.stop()) as wait, \
+                self.assertLogs('electionapp.scheduler', 'ERROR'):
+            scheduler.run()
+        wait.assert_called_once_with(60)
+
+    def test_run_scheduler_command_stops_on_interrupt(self):
+        out = io.StringIO()
+        with mock.patch.object(TransitionScheduler, 'run', side_effect=KeyboardInterrupt), \
+                mock.patch.object(TransitionScheduler, 'stop') as stop:
+            call_command('run_scheduler', stdout=out)
+        self.assertIn("Election scheduler running", out.getvalue())
+        stop.assert_called_once_with()
+
+    @override_settings(BACKGROUND_TASK_BACKEND='celery')
+    def test_celery_gets_one_eta_task_per_upcoming_date(self):
+        now = timezone.now()
+        with mock.patch('electionapp.tasks.apply_election_transitions.apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                election = create_election(self.liste, startdate=now + timedelta(hours=1), enddate=now + timedelta(hours=2))
+            with self.captureOnCommitCallbacks(execute=True):
+                election.save(update_fields=['nom'])
+        self.assertEqual(
+            [call.kwargs['eta'] for call in apply_async.call_args_list],
+            [election.startdate + timedelta(milliseconds=10), election.enddate + timedelta(milliseconds=10)],
+        )
+
+
+class ResultsCacheTests(ElectionTestCase):
+    def test_no_etag_without_a_shared_cache(self):
+        election = create_election(self.liste)
+        response = bearer(self.admin).get(f'/api/elections/{election.id}/resultats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+    @override_settings(SHARED_CACHE=True)
+    def test_conditional_get_checks_access_first(self):
+        election = create_election(self.liste, {'mention': ['INFO']}, opened=False)
+        publish_results(election)
+        url = f'/api/elections/{election.id}/resultats/'
+        student = create_student(10, mention='INFO')
+        client = bearer(student.user, student)
+        etag = client.get(url)['ETag']
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        outsider = create_student(11, mention='ECO')
+        guessed = results_etag(election.id, results_version(election.id), outsider.user_id)
+        response = bearer(outsider.user, outsider).get(url, HTTP_IF_NONE_MATCH=guessed)
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(QUERY_INSPECTOR_ENABLED=True, QUERY_BUDGET_STRICT=True)
+class QueryBudgetTests(ElectionTestCase):
+    # The middleware raises QueryBudgetExceeded past a view's query_budget;
+    # assert_query_budget additionally pins counts that must not grow with N.
+
+    def setUp(self):
+        super().setUp()
+        # Seeding the revoked-token cache is a one-off query per cache lifetime.
+        _warm_revoked()
+        self.student = create_student(10, classe=1, mention='INFO')
+        self.client = bearer(self.student.user, self.student)
+        self.admin_client = bearer(self.admin)
+
+    def create_elections(self, n):
+        criteria = [{}, {'mention': ['INFO']}, {'classe': ['1', '2']}, {'activite': ['SPORT'], 'sport_type': ['FOOT']}]
+        return [create_election(self.liste, criteria[i % len(criteria)]) for i in range(n)]
+
+    def list_queries(self, client):
+        with assert_query_budget(12, 'GET /api/elections/') as inspector:
+            response = client.get('/api/elections/')
+        self.assertEqual(response.status_code, 200)
+        return inspector.count
+
+    def test_election_list_does_not_grow_with_elections(self):
+        # Both sizes stay on the same side of ELIGIBILITY_ENGINE_MIN_ELECTIONS.
+        self.create_elections(16)
+        student, admin = self.list_queries(self.client), self.list_queries(self.admin_client)
+        self.create_elections(16)
+        self.assertEqual(self.list_queries(self.client), student)
+        self.assertEqual(self.list_queries(self.admin_client), admin)
+
+    def test_engine_only_serves_the_admin_list(self):
+        self.create_elections(16)
+        with mock.patch.object(EligibilityEngine, 'load', wraps=EligibilityEngine.load) as load:
+            self.assertEqual(self.client.get('/api/elections/').status_code, 200)
+            load.assert_not_called()
+            self.assertEqual(self.admin_client.get('/api/elections/').status_code, 200)
+            load.assert_called_once()
+
+    def test_results_and_vote_stay_within_budget(self):
+        election = self.create_elections(1)[0]
+        with assert_query_budget(16, 'POST vote'):
+            response = self.client.post(f'/api/elections/{election.id}/vote/', {'candidate': self.candidats[0].id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        with assert_query_budget(16, 'GET resultats'):
+            response = self.admin_client.get(f'/api/elections/{election.id}/resultats/')
+        self.assertEqual(response.status_code, 200)
+
+
+def random_criteria(rng, activites):
+    # Includes values no student has, malformed classes and empty lists.
+    criteria = {}
+    if rng.random() < 0.5:
+        criteria['classe'] = rng.sample(['1', '2', '3', '4', '5', '01', ' 3', 'L1', 1, 3], rng.randint(0, 3))
+    if rng.random() < 0.5:
+        criteria['mention'] = rng.sample(['INFO', 'ECO', 'DROIT', 'SA', 'XX'], rng.randint(0, 2))
+    if rng.random() < 0.6:
+        criteria['activite'] = rng.sample(activites + ['AUTRE'], rng.randint(0, 3))
+    if rng.random() < 0.6:
+        criteria['sport_type'] = rng.sample(['FOOT', 'BASKET', 'VOLLEY', 'PET', 'XX'], rng.randint(0, 2))
+    return criteria
+
+
+class EligibilityTests(ElectionTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        rng = random.Random(2024)
+        for i in range(60):
+            student = create_student(
+                100 + i, classe=rng.randint(1, 5), mention=rng.choice(['INFO', 'ECO', 'DROIT', 'SA']),
+                sport_type=rng.choice([None, 'FOOT', 'BASKET', 'VOLLEY']),
+            )
+            student.activites.set([activite for activite in cls.activites.values() if rng.random() < 0.3])
+        cls.elections = [create_election(cls.liste, random_criteria(rng, list(cls.activites))) for _ in range(40)]
+
+    def test_criteria_to_q_matches_is_voter_allowed(self):
+        students = list(Utilisateur.objects.prefetch_related('activites'))
+        for election in self.elections:
+            expected = {student.id for student in students if election.is_voter_allowed(student)}
+            actual = set(Utilisateur.objects.filter(criteria_to_q(election.allowed_voter_criteria)).values_list('id', flat=True))
+            self.assertEqual(actual, expected, election.allowed_voter_criteria)
+
+    def test_engine_and_rules_table_match_is_voter_allowed(self):
+        students = list(Utilisateur.objects.prefetch_related('activites'))
+        engine = EligibilityEngine.load()
+        for election in self.elections:
+            expected = {student.id for student in students if election.is_voter_allowed(student)}
+            actual = set(engine.ids[engine.mask(election.allowed_voter_criteria)].tolist())
+            self.assertEqual(actual, expected, election.allowed_voter_criteria)
+        for student in students:
+            expected = {election.id for election in self.elections if election.is_voter_allowed(student)}
+            self.assertEqual(set(elections_for(student).values_list('id', flat=True)), expected, student.classe)
+
+    def test_failed_rule_sync_keeps_the_old_rules(self):
+        election = create_election(self.liste, {'mention': ['INFO']})
+        election.allowed_voter_criteria = {'mention': ['ECO']}
+        with mock.patch.object(ElectionEligibility.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                election.save()
+        self.assertEqual(list(election.eligibility_rules.values_list('valeur', flat=True)), ['INFO'])
+
+    def test_integer_classe_matches_no_one(self):
+        election = create_election(self.liste, {'classe': [1]})
+        student = create_student(10, classe=1)
+        self.assertFalse(election.is_voter_allowed(student))
+        self.assertFalse(elections_for(student).filter(pk=election.pk).exists())
+
+
+class SerialFrameTests(SimpleTestCase):
+    def test_parse_frame(self):
+        self.assertEqual(parse_frame(b'ENROLL_SUCCESS:12:OK\r\n'), SensorEvent('ENROLL_SUCCESS', '12', 'OK', 'ENROLL_SUCCESS:12:OK'))
+        self.assertEqual(parse_frame(b'VERIFY_FAILED\n'), SensorEvent('VERIFY_FAILED', None, 'FAILED', 'VERIFY_FAILED'))
+        for line in (b'VERIFY\n', b'ENROLL_SUCCESS:12\n', b'Sensor ready\n', b'\xff\xfe\n', b''):
+            self.assertIsNone(parse_frame(line), line)
+
+    def test_reader_skips_echo_and_noise_over_loop(self):
+        reader = FingerprintReader('loop://', warmup=0)
+        self.addCleanup(reader.close)
+        # loop:// echoes our own command back before the response frame.
+        reader.send_command('VERIFY')
+        reader.ser.write(b'debug: finger placed\nENROLL_SUCCESS:3:OK\nVERIFY_SUCCESS:7:OK\n')
+        self.assertEqual(reader.read_verify(timeout=1), ('7', 'OK'))
+
+    def test_reader_times_out_at_the_deadline(self):
+        reader = FingerprintReader('loop://', warmup=0)
+        self.addCleanup(reader.close)
+        self.assertEqual(reader.read_enroll(timeout=0.2), (None, 'TIMEOUT'))
+
+    @unittest.skipUnless(hasattr(os, 'openpty'), "needs a pseudo-terminal")
+    def test_second_reader_on_a_port_is_refused(self):
+        controller, device = os.openpty()
+        self.addCleanup(os.close, controller)
+        self.addCleanup(os.close, device)
+        reader = FingerprintReader(os.ttyname(device), warmup=0)
+        self.addCleanup(reader.close)
+        with self.assertRaises(SensorOwnedElsewhere):
+            FingerprintReader(os.ttyname(device), warmup=0)
+
+    def test_biometric_sessions_have_their_own_queue(self):
+        self.assertEqual(_queue_for(run_biometric_session), 'biometric')
+        self.assertEqual(_queue_for(run_user_import), 'default')
+
+
+class LogConfigTests(SimpleTestCase):
+    def record(self, **extra):
+        record = logging.LogRecord('django.request', logging.WARNING, __file__, 1, "Forbidden: %s", ('/api/',), None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_only_whitelisted_extras_are_written(self):
+        request = mock.Mock(__repr__=lambda self: '<WSGIRequest: GET /stream/?ticket=secret>')
+        entry = json.loads(JsonFormatter().format(self.record(status_code=403, request=request, db_time_ms=1.5)))
+        self.assertEqual(entry['message'], "Forbidden: /api/")
+        self.assertEqual(entry['status_code'], 403)
+        self.assertEqual(entry['db_time_ms'], 1.5)
+        self.assertNotIn('request', entry)
+        self.assertNotIn('secret', json.dumps(entry))
+
+    def test_listener_starts_with_the_first_record_of_each_process(self):
+        handler = QueueStreamHandler()
+        self.addCleanup(handler.stop)
+        handler.stream = mock.Mock(level=logging.NOTSET)
+        self.assertIsNone(handler.listener)
+        handler.handle(self.record())
+        listener = handler.listener
+        self.assertIsNotNone(listener)
+        with mock.patch('os.getpid', return_value=os.getpid() + 1):
+            handler.handle(self.record())
+            self.assertIsNot(handler.listener, listener)
+            handler.stop()
+        listener.stop()
+        self.assertEqual(handler.stream.handle.call_count, 2)
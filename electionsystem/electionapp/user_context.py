@@ -0,0 +1,105 @@
+from django.conf import settings
+from django.core.cache import cache
+import copy
+import threading
+import time
+
+# Request-scoped lookup of the authenticated user's Utilisateur (with user and
+# activites loaded), optionally backed by a per-process cache for
+# USER_CONTEXT_CACHE_TTL seconds. With a SHARED_CACHE, tokens carrying the
+# student's claims skip the database entirely while their profile_version is
+# current; a per-process cache would miss invalidations made by other
+# workers, so the claims are ignored there. Code that changes a student must
+# call invalidate_utilisateur(s) so the next request reloads it.
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _version_key(user_id):
+    return f"profile-version:{user_id}"
+
+
+def profile_version(user_id):
+    # Clock-seeded like the results version: after an eviction the value
+    # changes, so old tokens fall back to the database instead of being trusted.
+    return cache.get_or_set(_version_key(user_id), lambda: int(time.time() * 1000), timeout=None)
+
+
+def _from_claims(claims, user_id):
+    from .models import Utilisateur, Activite
+    utilisateur = Utilisateur(
+        id=claims['id'], user_id=user_id, nom=claims['nom'], classe=claims['classe'], mention=claims['mention'],
+        sport_type=claims['sport_type'], is_first_login=claims['is_first_login'], fingerprint_id=claims['fingerprint_id'],
+    )
+    utilisateur._state.adding = False
+    activites = utilisateur.activites.all()
+    activites._result_cache = [Activite(nom=nom) for nom in claims['activites']]
+    activites._prefetch_done = True
+    utilisateur._prefetched_objects_cache = {'activites': activites}
+    return utilisateur
+
+
+def _load(user_id):
+    from .models import Utilisateur
+    return Utilisateur.objects.select_related('user').prefetch_related('activites').filter(user_id=user_id).first()
+
+
+def _cached(user_id):
+    ttl = getattr(settings, 'USER_CONTEXT_CACHE_TTL', 0)
+    if not ttl:
+        return _load(user_id)
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(user_id)
+    if entry is not None and entry[0] > now:
+        utilisateur = entry[1]
+    else:
+        utilisateur = _load(user_id)
+        with _cache_lock:
+            if len(_cache) >= getattr(settings, 'USER_CONTEXT_CACHE_SIZE', 10000):
+                _cache.clear()
+            _cache[user_id] = (now + ttl, utilisateur)
+    # Each request gets its own instance; the prefetched activites are shared.
+    return copy.copy(utilisateur) if utilisateur is not None else None
+
+
+def get_utilisateur(request):
+    """The Utilisateur of request.user, or None (anonymous or no profile)."""
+    target = getattr(request, '_request', request)
+    if not hasattr(target, '_utilisateur'):
+        user = getattr(request, 'user', None)
+        token = getattr(request, 'auth', None)
+        if user is None or not user.is_authenticated:
+            target._utilisateur = None
+        elif (getattr(settings, 'SHARED_CACHE', False) and token is not None and 'utilisateur' in token
+              and token.get('profile_version') == profile_version(user.id)):
+            target._utilisateur = _from_claims(token['utilisateur'], user.id)
+        else:
+            target._utilisateur = _cached(user.id)
+    return target._utilisateur
+
+
+def resolve_utilisateur(request):
+    # Drop-in for Utilisateur.objects.get(user=request.user).
+    from .models import Utilisateur
+    utilisateur = get_utilisateur(request)
+    if utilisateur is None:
+        raise Utilisateur.DoesNotExist("Utilisateur matching query does not exist.")
+    return utilisateur
+
+
+def invalidate_utilisateurs(user_ids):
+    with _cache_lock:
+        for user_id in user_ids:
+            _cache.pop(user_id, None)
+    # Clock-based, but always past the current value: a token minted in the
+    # same millisecond must not keep matching.
+    keys = {_version_key(user_id): user_id for user_id in user_ids}
+    current = cache.get_many(list(keys))
+    now = int(time.time() * 1000)
+    cache.set_many({key: max(now, current.get(key, 0) + 1) for key in keys}, timeout=None)
+
+
+def invalidate_utilisateur(utilisateur):
+    invalidate_utilisateurs([utilisateur.user_id])
@@ -1,7 +1,7 @@
 # electionsystem/jwt_custom.py
 import logging
 logger = logging.getLogger(__name__)
-logger.info("Loading jwt_custom.py")  # Add this to check if file is imported
+logger.debug("Loading jwt_custom.py")
 
 def custom_payload_handler(user, token=None):
     payload = {
@@ -10,5 +10,5 @@ def custom_payload_handler(user, token=None):
         'is_staff': user.is_staff,
         'is_superuser': user.is_superuser,
     }
-    logger.info(f"JWT Payload for {user.username}: {payload}")
+    logger.debug("JWT Payload for %s: %s", user.username, payload)
     return payload
\ No newline at end of file
@@ -0,0 +1,86 @@
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import json
+import logging
+import os
+import queue
+
+# Only these `extra=` fields become top-level fields of the JSON line. Django
+# attaches the whole request object to its own records; writing its repr
+# would leak query strings (stream tickets, search terms) into the logs.
+EXTRA_FIELDS = frozenset({
+    'path', 'method', 'status', 'status_code', 'db_query_count', 'db_time_ms',
+    'db_duplicates', 'query_budget',
+})
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key in EXTRA_FIELDS.intersection(vars(record)):
+            entry[key] = getattr(record, key)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class QueueStreamHandler(QueueHandler):
+    """Hands records to a background QueueListener that writes them to stderr.
+
+    The request thread only merges the message arguments and enqueues the
+    record; formatting to JSON/text and the stream write happen on the
+    listener thread.
+
+    The listener is started on the first record of each process rather than
+    when the handler is configured, so a master that forks its workers
+    (gunicorn --preload, Celery prefork) does not leave them with a queue
+    nobody reads.
+    """
+
+    def __init__(self, json_output=True, fmt='%(asctime)s %(levelname)s %(name)s %(message)s'):
+        super().__init__(queue.SimpleQueue())
+        self.stream = logging.StreamHandler()
+        self.stream.setFormatter(JsonFormatter() if json_output else logging.Formatter(fmt))
+        self.listener = None
+        self._pid = None
+        atexit.register(self.stop)
+
+    def emit(self, record):
+        # Handler.handle holds self.lock around emit, so this runs once per process.
+        if self._pid != os.getpid():
+            self.queue = queue.SimpleQueue()
+            self.listener = QueueListener(self.queue, self.stream, respect_handler_level=False)
+            self.listener.start()
+            self._pid = os.getpid()
+        super().emit(record)
+
+    def stop(self):
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            self._pid = None
+
+
+def logging_config(level='INFO', json_output=True):
+    return {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'handlers': {
+            'console': {
+                '()': 'electionsystem.log_config.QueueStreamHandler',
+                'json_output': json_output,
+            },
+        },
+        'root': {'handlers': ['console'], 'level': level},
+        'loggers': {
+            # SQL logging is only useful when explicitly asked for.
+            'django.db.backends': {'level': 'INFO' if level == 'DEBUG' else level},
+        },
+    }
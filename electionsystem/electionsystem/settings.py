@@ -1,5 +1,8 @@
 from pathlib import Path
 from dotenv import load_dotenv
+from corsheaders.defaults import default_headers
+from .database import database_config
+from .log_config import logging_config
 
 load_dotenv()
 import os
@@ -26,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'electionapp.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -56,14 +60,49 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'electionsystem.wsgi.application'
+ASGI_APPLICATION = 'electionsystem.asgi.application'
 
+# DATABASE_URL selects PostgreSQL (postgres://...) or SQLite (sqlite:///...);
+# unset keeps the tracked db.sqlite3, in WAL mode only with SQLITE_WAL=True.
+# See electionsystem/database.py for the DB_CONN_MAX_AGE, DB_POOL* and
+# SQLITE_* knobs.
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_config(os.environ.get('DATABASE_URL', ''), BASE_DIR / 'db.sqlite3'),
 }
 
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'electionapp.hashers.BootstrapPBKDF2PasswordHasher',
+]
+
+# How initial (matricule) passwords are hashed on import/creation:
+# 'fast' (flagged low-cost hasher, upgraded at first login) or 'default'.
+BOOTSTRAP_PASSWORD_HASHING = os.environ.get('BOOTSTRAP_PASSWORD_HASHING', 'fast')
+# 1000 PBKDF2 rounds, deliberately. The bootstrap secret is the matricule,
+# a short sequential number that an attacker holding the hashes enumerates
+# in seconds at any iteration count, and it is replaced by the real password
+# at first login. More rounds only make a several-thousand-row import slower.
+BOOTSTRAP_PASSWORD_ITERATIONS = int(os.environ.get('BOOTSTRAP_PASSWORD_ITERATIONS', '1000'))
+
+# Logins hash on a bounded pool (see electionapp/login_pipeline.py); past
+# LOGIN_QUEUE_SIZE waiting checks the API login views answer 503 with
+# Retry-After. The request thread still waits for its own hash.
+AUTHENTICATION_BACKENDS = ['electionapp.login_pipeline.PooledModelBackend']
+LOGIN_HASH_WORKERS = int(os.environ.get('LOGIN_HASH_WORKERS', '0')) or None
+LOGIN_QUEUE_SIZE = int(os.environ.get('LOGIN_QUEUE_SIZE', '64'))
+# Seconds a successful username/password pair skips re-hashing (0 disables).
+LOGIN_CREDENTIAL_CACHE_TTL = int(os.environ.get('LOGIN_CREDENTIAL_CACHE_TTL', '300'))
+# Token buckets as (burst, refill per second).
+LOGIN_THROTTLE_IP = (int(os.environ.get('LOGIN_THROTTLE_IP_BURST', '300')), float(os.environ.get('LOGIN_THROTTLE_IP_RATE', '10')))
+LOGIN_THROTTLE_USERNAME = (int(os.environ.get('LOGIN_THROTTLE_USERNAME_BURST', '5')), float(os.environ.get('LOGIN_THROTTLE_USERNAME_RATE', '0.2')))
+# Reverse proxies in front of the app whose X-Forwarded-For is trusted for
+# the throttle's client IP; 0 uses REMOTE_ADDR.
+LOGIN_NUM_PROXIES = int(os.environ.get('LOGIN_NUM_PROXIES', '0'))
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -77,10 +116,13 @@ USE_I18N = True
 USE_TZ = True
 
 STATIC_URL = 'static/'
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': ['rest_framework_simplejwt.authentication.JWTAuthentication'],
+    # Stateless: the user, staff flags and student profile come from token claims.
+    'DEFAULT_AUTHENTICATION_CLASSES': ['electionapp.authentication.ClaimsJWTAuthentication'],
     'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated'],
 }
 
@@ -96,30 +138,111 @@ SIMPLE_JWT = {
     'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
 }
 
+# Local memory by default; point CACHE_URL at Redis (redis://...) when running
+# several workers so cache-backed state is shared between them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['CACHE_URL'],
+    } if os.environ.get('CACHE_URL') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+# Whether every worker process (web, Celery) sees the same cache. Cache-backed
+# invalidation (token claims, results versions) is only trusted when it does.
+SHARED_CACHE = bool(os.environ.get('CACHE_URL'))
+
+# Seconds a worker process may reuse a student's Utilisateur (with activites)
+# across requests; 0 keeps the lookup request-scoped only.
+USER_CONTEXT_CACHE_TTL = float(os.environ.get('USER_CONTEXT_CACHE_TTL', '0'))
+
+# Unpublished results payloads; published ones are cached without expiry.
+RESULTS_CACHE_TIMEOUT = int(os.environ.get('RESULTS_CACHE_TIMEOUT', '300'))
+# /resultats/stream/: at most this many updates per second per election, and a
+# keepalive comment when nothing changed for RESULTS_STREAM_HEARTBEAT seconds.
+RESULTS_STREAM_MAX_RATE = float(os.environ.get('RESULTS_STREAM_MAX_RATE', '2'))
+RESULTS_STREAM_HEARTBEAT = float(os.environ.get('RESULTS_STREAM_HEARTBEAT', '15'))
+# Streams are opened with a ticket valid for this many seconds. Under WSGI an
+# open stream holds a worker thread, so it is closed after
+# RESULTS_STREAM_WSGI_MAX_SECONDS and the browser reconnects; serve asgi.py
+# (e.g. gunicorn -k uvicorn.workers.UvicornWorker) to keep streams open.
+RESULTS_STREAM_TICKET_TTL = int(os.environ.get('RESULTS_STREAM_TICKET_TTL', '30'))
+RESULTS_STREAM_WSGI_MAX_SECONDS = float(os.environ.get('RESULTS_STREAM_WSGI_MAX_SECONDS', '60'))
+
 CORS_ALLOWED_ORIGINS = ['http://localhost:5173']
 CORS_ALLOW_CREDENTIALS = True
-CORS_EXPOSE_HEADERS = ['Authorization']
+CORS_ALLOW_HEADERS = (*default_headers, 'x-biometric-grant')
+CORS_EXPOSE_HEADERS = ['Authorization', 'ETag', 'X-DB-Query-Count', 'X-DB-Time-Ms', 'X-DB-Duplicate-Queries']
+
+QUERY_INSPECTOR_ENABLED = os.environ.get('QUERY_INSPECTOR_ENABLED', str(DEBUG)) == 'True'
+QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT', 'False') == 'True'
 
-CELERY_BROKER_URL = 'redis://localhost:6379/0'
-CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', CELERY_BROKER_URL)
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
+# 'celery' sends background work (user imports, ...) to the broker above;
+# 'thread' runs it on an in-process pool for deployments without Redis, which
+# then must run a single web process (fingerprint readers have one owner).
+BACKGROUND_TASK_BACKEND = os.environ.get('BACKGROUND_TASK_BACKEND', 'celery')
+USER_IMPORT_CHUNK_SIZE = int(os.environ.get('USER_IMPORT_CHUNK_SIZE', '1000'))
+
+# Elections open and close on time through ETA tasks (celery) or
+# `manage.py run_scheduler` (thread); beat, or the command's wake-ups, catch
+# anything missed within ELECTION_SCHEDULER_MAX_SLEEP seconds.
+ELECTION_SCHEDULER_MAX_SLEEP = float(os.environ.get('ELECTION_SCHEDULER_MAX_SLEEP', '60'))
+
 CELERY_BEAT_SCHEDULE = {
     'close-expired-elections': {
         'task': 'electionapp.tasks.close_expired_elections',
-        'schedule': 60.0,
+        'schedule': ELECTION_SCHEDULER_MAX_SLEEP,
     },
 }
 
-LOGGING = {
-    'version': 1,
-    'disable_existing_loggers': False,
-    'handlers': {'console': {'class': 'logging.StreamHandler'}},
-    'loggers': {'': {'handlers': ['console'], 'level': 'DEBUG', 'propagate': True}},
-}
+# JSON lines on stderr, written by a background listener thread. LOG_LEVEL=DEBUG
+# enables the diagnostic logs (eligibility checks, serializer dumps, ...).
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+LOGGING = logging_config(LOG_LEVEL, json_output=LOG_FORMAT == 'json')
 
 CURRENT_ACADEMIC_YEAR = "2024-2025"
 
+FINGERPRINT_SENSOR_PORT = os.environ.get('FINGERPRINT_SENSOR_PORT', 'COM6')
+# One reader per voting booth: FINGERPRINT_SENSORS="COM6@booth1,COM7@booth2,socket://10.0.0.5:7000"
+# (port or pyserial URL, optionally pinned to a booth id). Defaults to FINGERPRINT_SENSOR_PORT.
+FINGERPRINT_SENSORS = [
+    dict(zip(('port', 'booth'), entry.strip().split('@', 1)))
+    for entry in os.environ.get('FINGERPRINT_SENSORS', FINGERPRINT_SENSOR_PORT).split(',') if entry.strip()
+]
+FINGERPRINT_SENSOR_ACQUIRE_TIMEOUT = float(os.environ.get('FINGERPRINT_SENSOR_ACQUIRE_TIMEOUT', '60'))
+FINGERPRINT_SENSOR_BAUDRATE = int(os.environ.get('FINGERPRINT_SENSOR_BAUDRATE', '115200'))
+FINGERPRINT_SENSOR_WARMUP = float(os.environ.get('FINGERPRINT_SENSOR_WARMUP', '2'))
+FINGERPRINT_ENROLL_TIMEOUT = float(os.environ.get('FINGERPRINT_ENROLL_TIMEOUT', '30'))
+FINGERPRINT_VERIFY_TIMEOUT = float(os.environ.get('FINGERPRINT_VERIFY_TIMEOUT', '15'))
+# Each reader must be owned by one process (its port is opened exclusively),
+# so biometric sessions have their own queue. With celery, consume it from a
+# single worker process with a thread per sensor:
+#   celery -A electionsystem worker -Q biometric -P threads -c <sensors>
+# and keep it off the other workers. With the thread backend, run a single
+# web process; a second one gets SensorOwnedElsewhere instead of the reader.
+BIOMETRIC_TASK_QUEUE = os.environ.get('BIOMETRIC_TASK_QUEUE', 'biometric')
+CELERY_TASK_ROUTES = {
+    'electionapp.tasks.run_biometric_session': {'queue': BIOMETRIC_TASK_QUEUE},
+}
+# Thread backend: one pool per queue, so scans never starve user imports.
+BACKGROUND_TASK_WORKERS = int(os.environ.get('BACKGROUND_TASK_WORKERS', '2'))
+BACKGROUND_TASK_QUEUE_WORKERS = {BIOMETRIC_TASK_QUEUE: len(FINGERPRINT_SENSORS)}
+# Upper bound for ?wait= long-polling on /api/fingerprint/sessions/<id>/.
+BIOMETRIC_SESSION_MAX_WAIT = float(os.environ.get('BIOMETRIC_SESSION_MAX_WAIT', '10'))
+# A successful verify yields a signed, single-use grant valid for this many
+# seconds; with BIOMETRIC_VOTE_REQUIRED the vote endpoint insists on one.
+BIOMETRIC_GRANT_TTL = int(os.environ.get('BIOMETRIC_GRANT_TTL', '120'))
+BIOMETRIC_VOTE_REQUIRED = os.environ.get('BIOMETRIC_VOTE_REQUIRED', 'False') == 'True'
+# Exports and the admin election list count eligible voters with the NumPy
+# engine once they cover at least this many elections; students' lists always
+# use the SQL aggregate.
+ELIGIBILITY_ENGINE_MIN_ELECTIONS = int(os.environ.get('ELIGIBILITY_ENGINE_MIN_ELECTIONS', '10'))
+
 
@@ -16,12 +16,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework_simplejwt.views import TokenObtainPairView
 from electionapp import api_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('electionapp.urls')),
     path('api/token/', api_views.CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/refresh/', api_views.CachedTokenRefreshView.as_view(), name='token_refresh'),
 ]
\ No newline at end of file